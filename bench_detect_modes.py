@@ -0,0 +1,117 @@
+"""Сравнение режимов детекции "roi" и "frame" на записанных кадрах.
+
+Кадры лежат в FRAMES_DIR/<camera_id>/*.jpg (RECORD = True — сначала записать
+их с включённых камер). Рабочие места берутся из базы. Для каждого режима
+печатается среднее время цикла детекции и расхождение числа людей по местам.
+"""
+import os
+import glob
+import time
+from collections import defaultdict
+
+import cv2
+
+from database import SessionLocal
+import models
+import detect
+from services.capture import capture_manager
+
+# === НАСТРОЙКИ ===
+FRAMES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded_frames")
+RECORD = False        # записать свежие кадры с камер перед замером
+RECORD_COUNT = 5      # сколько кадров на камеру записывать
+RECORD_PAUSE_S = 2    # пауза между записанными кадрами
+REPEATS = 3           # прогонов каждого режима на один набор кадров
+MODES = ["roi", "frame"]
+
+
+def load_workstations():
+    with SessionLocal() as db:
+        rows = (
+            db.query(models.Workstation)
+            .join(models.Camera, models.Camera.id == models.Workstation.camera_id)
+            .filter(models.Workstation.enabled == True, models.Camera.enabled == True)
+            .all()
+        )
+        cameras = {c.id: c for c in db.query(models.Camera).filter(models.Camera.enabled == True).all()}
+        db.expunge_all()
+    by_camera = defaultdict(list)
+    for ws in rows:
+        by_camera[ws.camera_id].append(ws)
+    return cameras, by_camera
+
+
+def record_frames(cameras):
+    for n in range(RECORD_COUNT):
+        for camera in cameras.values():
+            _, frame = capture_manager.latest(camera.id, camera.rtsp_url)
+            if frame is None:
+                print(f"⚠️ Не удалось получить кадр с камеры {camera.name}")
+                continue
+            folder = os.path.join(FRAMES_DIR, str(camera.id))
+            os.makedirs(folder, exist_ok=True)
+            cv2.imwrite(os.path.join(folder, f"{int(time.time() * 1000)}.jpg"), frame)
+        time.sleep(RECORD_PAUSE_S)
+    capture_manager.stop_all()
+
+
+def load_cycles(by_camera):
+    """Наборы кадров: i-й цикл — i-й записанный кадр каждой камеры."""
+    files = {
+        camera_id: sorted(glob.glob(os.path.join(FRAMES_DIR, str(camera_id), "*.jpg")))
+        for camera_id in by_camera
+    }
+    files = {k: v for k, v in files.items() if v}
+    n = min((len(v) for v in files.values()), default=0)
+    return [{camera_id: cv2.imread(paths[i]) for camera_id, paths in files.items()} for i in range(n)]
+
+
+def run_mode(mode, cycles, by_camera):
+    timings, counts = [], []
+    for camera_frames in cycles:
+        items = [
+            (ws, detect.extract_roi(frame, ws))
+            for camera_id, frame in camera_frames.items()
+            for ws in by_camera[camera_id]
+        ]
+        for _ in range(REPEATS):
+            t0 = time.perf_counter()
+            boxes_list = detect.detect_boxes(camera_frames, items, mode=mode)
+            timings.append(time.perf_counter() - t0)
+        counts.append({ws.id: len(detect.person_boxes(b)) for (ws, _), b in zip(items, boxes_list)})
+    return timings, counts
+
+
+def main():
+    detect.load_models()
+    cameras, by_camera = load_workstations()
+    if RECORD:
+        record_frames(cameras)
+
+    cycles = load_cycles(by_camera)
+    if not cycles:
+        print(f"⚠️ Нет записанных кадров в {FRAMES_DIR}")
+        return
+    n_ws = sum(len(by_camera[c]) for c in cycles[0])
+    print(f"Циклов: {len(cycles)}, камер: {len(cycles[0])}, рабочих мест: {n_ws}")
+
+    results = {}
+    for mode in MODES:
+        timings, counts = run_mode(mode, cycles, by_camera)
+        results[mode] = counts
+        mean = sum(timings) / len(timings)
+        print(f"{mode:>6}: {mean * 1000:8.1f} мс/цикл, min {min(timings) * 1000:.1f}, max {max(timings) * 1000:.1f}")
+
+    # совпадение числа людей по рабочим местам между режимами
+    base, other = results[MODES[0]], results[MODES[1]]
+    total = same = 0
+    for a, b in zip(base, other):
+        for ws_id, cnt in a.items():
+            total += 1
+            same += int(cnt == b.get(ws_id))
+    if total:
+        print(f"Совпадение people_count {MODES[0]} vs {MODES[1]}: {same}/{total} ({same / total * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
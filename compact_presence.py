@@ -0,0 +1,33 @@
+"""Пересборка таблицы presence_intervals из frames за период.
+
+Нужна для заполнения истории после первого запуска и для сверки: detect.py
+продлевает интервалы инкрементально, а этот скрипт пересчитывает их
+целиком по суткам одним SQL-запросом. Если пересобран и текущий день,
+detect.py заметит устаревшие хвосты и перечитает их сам.
+"""
+from datetime import date, datetime, timedelta
+
+from database import engine
+from services.presence_intervals import rebuild_intervals
+from services.retention import frames_cutoff
+
+# === НАСТРОЙКИ ===
+START_DATE = date.today() - timedelta(days=30)
+# включительно; по умолчанию до вчера — сегодняшние хвосты продлевает detect.py
+END_DATE = date.today() - timedelta(days=1)
+
+
+def main():
+    # сырые frames старше срока хранения удалены (purge_frames.py) — пересборка стёрла бы интервалы
+    day = max(START_DATE, frames_cutoff().date())
+    while day <= END_DATE:
+        start = datetime.combine(day, datetime.min.time())
+        with engine.begin() as conn:
+            count = rebuild_intervals(conn, start, start + timedelta(days=1))
+        print(f"{day:%d.%m.%Y}: интервалов {count}")
+        day += timedelta(days=1)
+    print("✅ Пересборка завершена")
+
+
+if __name__ == "__main__":
+    main()
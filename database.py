@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from settings import settings
+import config
 
 # создаём движок SQLAlchemy для PostgreSQL
 engine = create_engine(
@@ -20,6 +22,21 @@ SessionLocal = sessionmaker(
     future=True
 )
 
+# асинхронный движок (asyncpg) для API — запросы роутеров не блокируют event loop
+async_engine = create_async_engine(
+    config.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_S,
+    pool_pre_ping=True,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False  # объекты читаются после commit без повторного запроса
+)
+
 # вспомогательная функция для использования с контекстом
 def get_db():
     db = SessionLocal()
@@ -1,197 +1,377 @@
 import os
 import time
 import datetime
+import uuid
 import cv2
-import numpy as np
 from ultralytics import YOLO
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import SessionLocal, engine
 import models
-import json
+from services.capture import capture_manager
+from services.motion import MotionGate
+from services.partitions import ensure_frame_partitions
+from services.rollup import refresh_recent
+from services.presence_intervals import presence_writer
+from services.presence import presence_tracker, publish_deltas
+from services.scheduler import CameraScheduler
+from services.geometry import geometry_cache, assign_boxes
+from services.inference_pool import InferencePool, InferenceTimeout
+from services.detector import detect_people_batch, detect_people_frames, classify_batch
+from settings import settings
+from collections import defaultdict
+
+# модели грузятся в load_models(): в этом процессе или в пуле процессов инференса
+model = None
+model_work = None
+inference_pool = None
+
+# значения frames.trigger: полный прогон моделей / результат перенесён с прошлого цикла
+TRIGGER_DETECT = "Поиск сотрудников"
+TRIGGER_CARRIED = "Без изменений"
+
+motion_gate = MotionGate()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # корень проекта (где лежит скрипт)
+IMAGES_ROOT = os.path.join(BASE_DIR, "images")  # папка images внутри проекта
+
+def load_models():
+    """Загружает модели один раз: при INFERENCE_WORKERS > 0 — в процессах пула."""
+    global model, model_work, inference_pool
+    if settings.INFERENCE_WORKERS > 0:
+        if inference_pool is None:
+            inference_pool = InferencePool(
+                settings.INFERENCE_WORKERS,
+                settings.DETECT_MODEL,
+                settings.CLASSIFY_MODEL,
+                imgsz=settings.DETECT_IMGSZ,
+                detect_batch_size=settings.DETECT_BATCH_SIZE,
+                classify_batch_size=settings.CLASSIFY_BATCH_SIZE,
+            )
+    elif model is None:
+        model = YOLO(settings.DETECT_MODEL)
+        model_work = YOLO(settings.CLASSIFY_MODEL)
+
+
+def run_detector(crops):
+    """Боксы людей (x1, y1, x2, y2, conf) для каждого кропа."""
+    if inference_pool is not None:
+        return inference_pool.detect(crops)
+    return detect_people_batch(
+        model, crops,
+        imgsz=settings.DETECT_IMGSZ,
+        batch_size=settings.DETECT_BATCH_SIZE,
+    )
+
+
+def run_classifier(crops):
+    """(класс, уверенность) активности для каждого кропа человека."""
+    if inference_pool is not None:
+        return inference_pool.classify(crops)
+    return classify_batch(model_work, crops, batch_size=settings.CLASSIFY_BATCH_SIZE)
+
+
+def extract_roi(frame, ws):
+    """Вырезает ROI рабочего места из кадра камеры (по polygon_points или x/y/w/h).
+
+    Маска и bounding rect берутся из кэша геометрии, поэтому обрабатываются
+    только пиксели внутри прямоугольника, а не весь кадр.
+    """
+    return geometry_cache.get(ws).crop(frame)
+
+
+def detect_boxes(camera_frames, items, mode=None):
+    """Боксы людей для каждого (ws, roi) из items в координатах ROI.
+
+    mode "roi" — один батч-прогон детектора по всем ROI цикла;
+    mode "frame" — один прогон по кадру каждой камеры, боксы раскладываются
+    по полигонам рабочих мест (выгодно, когда на камере много мест).
+    """
+    mode = mode or settings.DETECT_MODE
+    if mode == "frame":
+        camera_ids = list(camera_frames)
+        frame_boxes = detect_people_frames(
+            run_detector, [camera_frames[c] for c in camera_ids],
+            tiles=settings.DETECT_FRAME_TILES,
+        )
+        boxes_by_camera = dict(zip(camera_ids, frame_boxes))
+
+        # раскладываем боксы по рабочим местам покамерно
+        ws_by_camera = defaultdict(list)
+        for k, (ws, _) in enumerate(items):
+            ws_by_camera[ws.camera_id].append(k)
+        boxes_list = [[] for _ in items]
+        for camera_id, idx in ws_by_camera.items():
+            geoms = [geometry_cache.get(items[k][0]) for k in idx]
+            for k, boxes in zip(idx, assign_boxes(boxes_by_camera[camera_id], geoms)):
+                boxes_list[k] = boxes
+        return boxes_list
+
+    return run_detector([roi for _, roi in items])
+
+
+def person_boxes(boxes):
+    """Боксы, которые считаем человеком (уверенность > 50%)."""
+    return [b for b in boxes if b[4] * 100 > 50]
+
+
+def process_roi(ws, roi, boxes, labels):
+    """Подсчёт людей и активности на ROI, сохранение миниатюры; возвращает строку для frames.
+
+    boxes — боксы людей (x1, y1, x2, y2, conf) из батч-прогона детектора,
+    labels — (класс, уверенность) классификатора для каждого бокса из person_boxes(boxes).
+    """
+    person_found = 0
+    conf_percent = 0.0
+    job_type = 0
+    # класс 0 = "person" уже отфильтрован детектором
+    for x1, y1, x2, y2, conf in boxes:
+        curr_persent = conf * 100
+        if curr_persent > conf_percent:
+            conf_percent = curr_persent
+
+    for (x1, y1, x2, y2, conf), (cls_name, cls_conf) in zip(person_boxes(boxes), labels):
+        person_found += 1
+
+        if cls_name == "work_cropped":
+            job_color = (0, 255, 0)
+            cur_job_type = 3
+        elif cls_name == "phone_cropped":
+            job_color = (0, 0, 255)
+            cur_job_type = 2
+        else:
+            job_color = (255, 0, 0)
+            cur_job_type = 1
+
+        if cur_job_type > job_type:
+            job_type = cur_job_type
+
+        # рисуем рамку
+        cv2.rectangle(roi, (x1, y1), (x2, y2), job_color, 2)
+        cv2.putText(
+            roi,
+            f"{conf_percent:.1f}%",
+            (x1, max(y1-10, 0)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            2, (0,255,0), 4
+        )
 
-# загружаем модель
-model = YOLO("yolov10s.pt")
-model_work = YOLO("last_armis_cls_22Nov2025.pt")
+    captured_at = datetime.datetime.now()
 
-def process_workstations():
-    db: Session = SessionLocal()
-    try:
-        # получаем рабочие места с enabled=True
-        workstations = (
-            db.query(models.Workstation)
-            .filter(models.Workstation.enabled == True)
-            .all()
-        )
+    # имя подкаталога по дате
+    date_folder = datetime.datetime.utcnow().strftime("%d%b%Y")
+    folder = os.path.join(IMAGES_ROOT, date_folder)
 
-        for ws in workstations:
-            camera = db.query(models.Camera).filter_by(id=ws.camera_id, enabled=True).first()
-            if not camera:
-                continue
-
-            # захватываем кадр с камеры
-            cap = cv2.VideoCapture(camera.rtsp_url)
-            ret, frame = cap.read()
-            cap.release()
-            if not ret:
-                print(f"⚠️ Не удалось получить кадр с камеры {camera.name}")
-                continue
-
-            # === ROI ===
-            polygon = None
-            poly_data = getattr(ws, "polygon_points", None)
-
-            if poly_data:
-                try:
-                    # 1️⃣ если пришло как строка JSON — парсим
-                    if isinstance(poly_data, str):
-                        poly_data = json.loads(poly_data)
-
-                    # 2️⃣ если это список словарей — превращаем в список координат
-                    if isinstance(poly_data, list) and all(isinstance(p, dict) for p in poly_data):
-                        polygon = [[int(p["x"]), int(p["y"])] for p in poly_data]
-
-                    # 3️⃣ если это список списков — используем напрямую
-                    elif isinstance(poly_data, list) and all(isinstance(p, (list, tuple)) for p in poly_data):
-                        polygon = [[int(p[0]), int(p[1])] for p in poly_data]
-
-                    if polygon and len(polygon) >= 3:
-                        pts = np.array(polygon, np.int32)
-
-                        # создаём маску и заполняем полигон
-                        mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-                        cv2.fillPoly(mask, [pts], 255)
-
-                        # накладываем маску
-                        masked = cv2.bitwise_and(frame, frame, mask=mask)
-
-                        # обрезаем по bounding box
-                        x, y, w, h = cv2.boundingRect(pts)
-                        roi = masked[y:y + h, x:x + w]
-                    else:
-                        raise ValueError("polygon_points пуст или некорректен")
-
-                except Exception as e:
-                    print(f"⚠️ Ошибка polygon_points для ws {ws.id}: {e}")
-                    roi = frame[ws.y:ws.y + ws.h, ws.x:ws.x + ws.w]
-            else:
-                roi = frame[ws.y:ws.y + ws.h, ws.x:ws.x + ws.w]
-
-            # запускаем модель
-            results = model.predict(roi, verbose=False)
-
-            person_found = 0
-            conf_percent = 0.0
-            job_type = 0
-            for r in results:
-                for box, cls, conf in zip(r.boxes.xyxy, r.boxes.cls, r.boxes.conf):
-                    if int(cls) == 0:  # класс 0 = "person"
-
-                        curr_persent = float(conf.item()) * 100
-                        if curr_persent > conf_percent:
-                            conf_percent = curr_persent
-
-
-                        if curr_persent > 50:
-                            person_found += 1
-                            # рисуем рамку
-                            x1, y1, x2, y2 = map(int, box)
-
-                            crop = roi[y1:y2, x1:x2]
-                            cv2.imwrite("test1.jpg", crop)
-                            cls_results = model_work.predict(crop)
-
-                            try:
-                                cr = cls_results[0]
-                                cls_id = int(cr.probs.top1)
-                                cls_name = cr.names[cls_id]
-                                cls_conf = float(cr.probs.top1conf)
-                            except Exception as e:
-                                cls_id = -1
-                                cls_name = ""
-                                cls_conf = 0
-
-
-                            if cls_name == "work_cropped":
-                                job_color = (0, 255, 0)
-                                cur_job_type = 3
-                            elif cls_name == "phone_cropped":
-                                job_color = (0, 0, 255)
-                                cur_job_type = 2
-                            else:
-                                job_color = (255, 0, 0)
-                                cur_job_type = 1
-
-                            if cur_job_type > job_type:
-                                job_type = cur_job_type
-
-                            cv2.rectangle(roi, (x1, y1), (x2, y2), job_color, 2)
-                            cv2.putText(
-                                roi,
-                                f"{conf_percent:.1f}%",
-                                (x1, max(y1-10, 0)),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                2, (0,255,0), 4
-                            )
-
-                            # проверяем, работает человек на вырезанном фрагменте или нет
-
-                            # break
-
-            BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # корень проекта (где лежит скрипт)
-            images_root = os.path.join(BASE_DIR, "images")  # папка images внутри проекта
-
-
-
-            # создаём запись в frames
-
-            frame_rec = models.Frame(
-                workstation_id=ws.id,
-                captured_at=datetime.datetime.now(),
-                trigger="Поиск сотрудников",
-                people_count=person_found,
-                conf=conf_percent,
-                job_type = job_type
-            )
-            db.add(frame_rec)
-            db.commit()
-            db.refresh(frame_rec)
+    # создаём папку если её нет
+    os.makedirs(folder, exist_ok=True)
+
+    # сохраняем только ROI; имя из клиентского uuid — id строки в БД для него не нужен
+    filename = f"{ws.id}_{uuid.uuid4().hex}.jpg"
+    filepath = os.path.join(folder, filename)
+    cv2.imwrite(filepath, roi)
+
+    print(f"💾 Сохранён фрагмент {filepath}, person_found={person_found}, job_type={job_type}")
 
-            # имя подкаталога по дате
-            date_folder = datetime.datetime.utcnow().strftime("%d%b%Y")
-            folder = os.path.join(images_root, date_folder)
+    # строка для frames; пишется общим INSERT в save_frames()
+    return {
+        "workstation_id": ws.id,
+        "captured_at": captured_at,
+        "trigger": TRIGGER_DETECT,
+        "people_count": person_found,
+        "conf": conf_percent,
+        "job_type": job_type,
+        "thumb_path": date_folder + '/' + filename,
+    }
 
-            # создаём папку если её нет
-            os.makedirs(folder, exist_ok=True)
 
-            # сохраняем только ROI
-            filename = f"{ws.id}_{frame_rec.id}.jpg"
-            filepath = os.path.join(folder, filename)
-            cv2.imwrite(filepath, roi)
+def carry_over(ws, prev, score):
+    """ROI не изменился — строка frames с прошлым результатом, без запуска моделей."""
+    print(f"⏭ ws {ws.id} без изменений (score={score:.3f}), person_found={prev['people_count']}")
 
-            # обновляем запись с путём
-            frame_rec.thumb_path = date_folder + '/' +filename
-            db.commit()
+    return {
+        **prev,
+        "workstation_id": ws.id,
+        "captured_at": datetime.datetime.now(),
+        "trigger": TRIGGER_CARRIED,
+    }
 
 
+def save_frames(db: Session, rows):
+    """Все строки frames за цикл — одним многострочным INSERT в одной транзакции.
+
+    Возвращает изменения присутствия за цикл.
+    """
+    try:
+        if rows:
+            db.execute(insert(models.Frame), rows)
+            # в той же транзакции продлеваем интервалы присутствия для отчёта
+            presence_writer.add_frames(db, rows)
+        # presence_state — только переходы; таймер отсутствия идёт и без новых кадров
+        deltas = presence_tracker.update(db, rows)
+        # NOTIFY транзакционный: API узнает об изменениях только после commit
+        publish_deltas(db, deltas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        # состояние в памяти могло разойтись с базой — перечитаем в следующий раз
+        presence_writer.reset()
+        presence_tracker.reset()
+        raise
+
+    for d in deltas:
+        print(f"👤 ws {d['workstation_id']}: {'на месте' if d['is_present'] else 'отсутствует'}")
+    return deltas
+
+
+def process_workstations(camera_ids=None):
+    """Один цикл детекции по рабочим местам камер camera_ids (None — все включённые камеры)."""
+    load_models()
+    db: Session = SessionLocal()
+    try:
+        # получаем рабочие места с enabled=True вместе с их включёнными камерами
+        query = (
+            db.query(models.Workstation, models.Camera)
+            .join(models.Camera, models.Camera.id == models.Workstation.camera_id)
+            .filter(models.Workstation.enabled == True, models.Camera.enabled == True)
+        )
+        if camera_ids is not None:
+            query = query.filter(models.Camera.id.in_(camera_ids))
+        rows = query.all()
+
+        # группируем рабочие места по камерам: один кадр на камеру за цикл
+        cameras = {}
+        by_camera = defaultdict(list)
+        for ws, camera in rows:
+            cameras[camera.id] = camera
+            by_camera[camera.id].append(ws)
+
+        # захватываем кадры со всех камер параллельно: мёртвая камера не держит остальные
+        camera_frames, failed = capture_manager.fetch_many([cameras[c] for c in by_camera])
+        for camera_id, reason in failed.items():
+            print(f"⚠️ Не удалось получить кадр с камеры {cameras[camera_id].name} ({reason}), пропускаем")
+
+        # (ws, roi) всех рабочих мест за цикл
+        items = []
+        for camera_id, frame in camera_frames.items():
+            # раздаём один и тот же кадр всем рабочим местам камеры
+            for ws in by_camera[camera_id]:
+                items.append((ws, extract_roi(frame, ws)))
+
+        # строки frames за цикл
+        frame_rows = []
+
+        # рабочие места без изменений в кадре не гоняем через модели — повторяем прошлый результат
+        if settings.MOTION_GATE_ENABLED:
+            changed = []
+            for ws, roi in items:
+                infer, prev, score = motion_gate.check(ws, roi)
+                if infer:
+                    changed.append((ws, roi))
+                else:
+                    frame_rows.append(carry_over(ws, prev, score))
+            items = changed
+            camera_frames = {c: f for c, f in camera_frames.items()
+                             if any(ws.camera_id == c for ws, _ in items)}
+
+        boxes_list = detect_boxes(camera_frames, items)
+
+        # кропы людей со всех ROI цикла — одним батчем в классификатор активности
+        persons = [person_boxes(boxes) for boxes in boxes_list]
+        crops = [
+            roi[y1:y2, x1:x2]
+            for (_, roi), ps in zip(items, persons)
+            for x1, y1, x2, y2, _ in ps
+        ]
+        labels = run_classifier(crops)
+
+        pos = 0
+        for (ws, roi), boxes, ps in zip(items, boxes_list, persons):
+            row = process_roi(ws, roi, boxes, labels[pos:pos + len(ps)])
+            pos += len(ps)
+            frame_rows.append(row)
+            if settings.MOTION_GATE_ENABLED:
+                motion_gate.remember(ws, row)
+
+        save_frames(db, frame_rows)
 
-            print(f"💾 Сохранён фрагмент {filepath}, person_found={person_found}, job_type={job_type}")
+    finally:
+        db.close()
 
+def expire_presence():
+    """Таймер отсутствия без нового цикла детекции: вне рабочих часов и пока камеры не опрашиваются."""
+    db: Session = SessionLocal()
+    try:
+        save_frames(db, [])
+    except Exception as e:
+        print(f"⚠️ Не удалось обновить присутствие: {e}")
     finally:
         db.close()
 
+def in_working_hours():
+    now = datetime.datetime.now().time()
+    return settings.WORK_START <= now <= settings.WORK_END
+
+
+def load_poll_intervals():
+    """{camera_id: poll_interval_s} включённых камер."""
+    with SessionLocal() as db:
+        rows = (
+            db.query(models.Camera.id, models.Camera.poll_interval_s)
+            .filter(models.Camera.enabled == True)
+            .all()
+        )
+    return {camera_id: interval for camera_id, interval in rows}
+
+
 def main():
+    scheduler = CameraScheduler()
+    partitions_checked = None
+    rollup_at = 0.0
     while True:
-        now = datetime.datetime.now().time()
-        start = datetime.time(5, 30)
-        end = datetime.time(20, 0)
-
-        if start <= now <= end:
-            process_workstations()
+        # партиции frames на текущий и следующие месяцы — раз в сутки
+        today = datetime.date.today()
+        if partitions_checked != today:
+            ensure_frame_partitions(engine)
+            partitions_checked = today
+
+        # часовые агрегаты для /api/stats — раз в ROLLUP_REFRESH_S
+        if time.monotonic() - rollup_at >= settings.ROLLUP_REFRESH_S:
+            try:
+                refresh_recent(engine)
+            except Exception as e:
+                print(f"⚠️ Не удалось обновить frames_hourly: {e}")
+            rollup_at = time.monotonic()
+
+        if not in_working_hours():
+            print(f"⏸ Вне рабочего интервала ({settings.WORK_START:%H:%M}-{settings.WORK_END:%H:%M})")
+            expire_presence()
+            time.sleep(settings.DETECT_IDLE_SLEEP_S)
+            continue
+
+        # список камер и их интервалы могли поменять в UI
+        scheduler.sync(load_poll_intervals())
+
+        # камеры, чей срок подошёл, обрабатываем одним батчем
+        due = scheduler.pop_due(window=settings.DETECT_BATCH_WINDOW_S)
+        if due:
+            try:
+                process_workstations(due)
+            except InferenceTimeout as e:
+                # пул уже пересоздан — пропускаем цикл, камеры опросятся в следующий срок
+                print(f"⚠️ Цикл детекции пропущен: {e}")
+            except Exception as e:
+                # save_frames уже откатил транзакцию и сбросил состояние — следующий цикл начнётся с базы
+                print(f"⚠️ Ошибка цикла детекции: {e}")
         else:
-            print("⏸ Вне рабочего интервала (05:30-20:00)")
+            # ни одна камера не опрашивается — «есть» всё равно должно истечь по таймеру
+            expire_presence()
 
-        # спим минимальный интервал
-        time.sleep(10)
+        # спим до ближайшего срока опроса
+        next_due = scheduler.next_due()
+        if next_due is None:
+            time.sleep(settings.DETECT_IDLE_SLEEP_S)
+        else:
+            time.sleep(min(max(next_due - time.monotonic(), 0), settings.DETECT_IDLE_SLEEP_S))
 
 if __name__ == "__main__":
     main()
@@ -1,22 +1,29 @@
 import os
 from fastapi import FastAPI, Request, WebSocket
 from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from database import engine, Base, SessionLocal
+from sqlalchemy import select
+from database import engine, Base, AsyncSessionLocal, async_engine
 from settings import settings
-from routers import cameras, workstations, frames, events, ws
+from routers import cameras, workstations, frames, events, stats, ws
 from models import Camera, Workstation, Frame
+from services.capture import capture_manager
+from services.broadcast import broadcast_manager
+from services.http_cache import ImmutableStaticFiles
+from services.partitions import ensure_frame_indexes, ensure_frame_partitions
 import uvicorn
 
 app = FastAPI(title=settings.APP_NAME)
 Base.metadata.create_all(bind=engine)
+ensure_frame_partitions(engine)
+ensure_frame_indexes(engine)
 
 # include routers
 app.include_router(cameras.router)
 app.include_router(workstations.router)
 app.include_router(frames.router)
 app.include_router(events.router)
+app.include_router(stats.router)
 app.include_router(ws.router)
 
 # templates & static (simple UI)
@@ -24,13 +31,34 @@ TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
 os.makedirs(TEMPLATES_DIR, exist_ok=True)
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
-app.mount("/images", StaticFiles(directory="images"), name="images")
+# миниатюры не меняются после записи — браузер кэширует их надолго
+app.mount("/images", ImmutableStaticFiles(directory="images"), name="images")
+
+@app.on_event("startup")
+async def start_presence_listener():
+    # изменения присутствия от detect.py приходят через LISTEN/NOTIFY
+    ws.start_presence_listener()
+
+@app.on_event("shutdown")
+async def stop_presence_listener():
+    await ws.stop_presence_listener()
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    await async_engine.dispose()
+
+@app.on_event("shutdown")
+def stop_captures():
+    # закрываем трансляции и RTSP-подключения потоков захвата
+    broadcast_manager.stop_all()
+    capture_manager.stop_all()
+
 @app.get('/', response_class=HTMLResponse)
 async def index(request: Request):
-    with SessionLocal() as db:
-        cams = db.query(Camera).all()
-        ws_list = db.query(Workstation).all()
-        frames = db.query(Frame).order_by(Frame.captured_at.desc()).limit(50).all()
+    async with AsyncSessionLocal() as db:
+        cams = (await db.execute(select(Camera))).scalars().all()
+        ws_list = (await db.execute(select(Workstation))).scalars().all()
+        frames = (await db.execute(select(Frame).order_by(Frame.captured_at.desc()).limit(50))).scalars().all()
         return templates.TemplateResponse('index.html', {'request':request, 'cams':cams, 'ws':ws_list, 'frames':frames, 'app_name':settings.APP_NAME})
 
 if __name__ == "__main__":
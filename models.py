@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey,JSON
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from database import Base
@@ -27,18 +27,57 @@ class Workstation(Base):
 
 class Frame(Base):
     __tablename__ = "frames"
-    id = Column(Integer, primary_key=True)
+    # помесячные партиции по captured_at (services/partitions.py), поэтому captured_at входит в PK;
+    # id в конце индексов — для keyset-пагинации по (captured_at, id) в /api/frames
+    __table_args__ = (
+        Index('ix_frames_workstation_id_captured_at', 'workstation_id', 'captured_at', 'id'),
+        Index('ix_frames_captured_at_cover', 'captured_at', 'id',
+              postgresql_include=['people_count', 'conf', 'job_type']),
+        {'postgresql_partition_by': 'RANGE (captured_at)'},
+    )
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
     workstation_id = Column(Integer, ForeignKey('workstations.id'), nullable=False)
-    captured_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    captured_at = Column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc))
     trigger = Column(String(100), nullable=False)
     people_count = Column(Integer, nullable=False, default=0)
     thumb_path = Column(String(1000), nullable=True)
     conf = Column(Integer, nullable=False, default=0)
     job_type = Column(Integer, nullable=False, default=0)
 
+class FrameHourly(Base):
+    __tablename__ = "frames_hourly"
+    # часовые агрегаты frames по рабочим местам (services/rollup.py) — источник для /api/stats
+    __table_args__ = (
+        Index('ix_frames_hourly_hour', 'hour'),
+    )
+    workstation_id = Column(Integer, ForeignKey('workstations.id'), primary_key=True)
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    frames = Column(Integer, nullable=False, default=0)
+    present_frames = Column(Integer, nullable=False, default=0)      # кадры с people_count > 0
+    minutes = Column(Integer, nullable=False, default=0)             # минуты, за которые есть кадры
+    present_minutes = Column(Integer, nullable=False, default=0)     # минуты, когда человек был хотя бы в одном кадре
+    conf_sum = Column(BigInteger, nullable=False, default=0)         # сумма conf по present_frames
+    conf_max = Column(Integer, nullable=False, default=0)
+    job_other = Column(Integer, nullable=False, default=0)           # кадры по job_type: 1 — прочее,
+    job_phone = Column(Integer, nullable=False, default=0)           # 2 — телефон,
+    job_work = Column(Integer, nullable=False, default=0)            # 3 — работа
+
 class PresenceState(Base):
     __tablename__ = "presence_state"
     id = Column(Integer, primary_key=True)
     workstation_id = Column(Integer, ForeignKey('workstations.id'), unique=True)
     is_present = Column(Boolean, default=False)
     last_seen = Column(DateTime(timezone=True), nullable=True)
+
+class PresenceInterval(Base):
+    __tablename__ = "presence_intervals"
+    # непрерывные отрезки присутствия/отсутствия с точностью до минуты (services/presence_intervals.py)
+    __table_args__ = (
+        Index('ix_presence_intervals_workstation_id_start_at', 'workstation_id', 'start_at'),
+        Index('ix_presence_intervals_start_at', 'start_at'),
+    )
+    id = Column(BigInteger, primary_key=True)
+    workstation_id = Column(Integer, ForeignKey('workstations.id'), nullable=False)
+    is_present = Column(Boolean, nullable=False)
+    start_at = Column(DateTime(timezone=True), nullable=False)
+    end_at = Column(DateTime(timezone=True), nullable=False)
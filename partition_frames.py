@@ -0,0 +1,52 @@
+"""Одноразовый перевод таблицы frames в помесячные партиции по captured_at.
+
+Старая таблица переименовывается в frames_old, создаётся партиционированная
+frames с индексами из models.Frame, данные копируются, счётчик id
+продолжается с прежнего значения. frames_old остаётся для проверки —
+удалить вручную: DROP TABLE frames_old;
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import engine
+import models
+from services.partitions import ensure_frame_partitions, frames_is_partitioned
+
+
+def main():
+    with engine.begin() as conn:
+        if frames_is_partitioned(conn):
+            print("✅ Таблица frames уже партиционирована")
+            ensure_frame_partitions(conn)
+            return
+
+        # освобождаем имена таблицы, PK, последовательности и индексов для новой frames
+        conn.execute(text("ALTER TABLE frames RENAME TO frames_old"))
+        conn.execute(text("ALTER TABLE frames_old RENAME CONSTRAINT frames_pkey TO frames_old_pkey"))
+        conn.execute(text("ALTER SEQUENCE IF EXISTS frames_id_seq RENAME TO frames_old_id_seq"))
+        # имена индексов уникальны в схеме — индексы models.Frame на старой таблице тоже переименовываем
+        for index in models.Frame.__table__.indexes:
+            conn.execute(text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_old"))
+
+        models.Frame.__table__.create(conn)
+
+        lo, hi = conn.execute(text("SELECT min(captured_at), max(captured_at) FROM frames_old")).one()
+        now = datetime.now()
+        names = ensure_frame_partitions(conn, start=lo or now, end=max(hi or now, now))
+        print(f"Создано партиций: {len(names)} ({names[0]} … {names[-1]})")
+
+        copied = conn.execute(text("""
+            INSERT INTO frames (id, workstation_id, captured_at, trigger, people_count, thumb_path, conf, job_type)
+            SELECT id, workstation_id, COALESCE(captured_at, now()), trigger, people_count, thumb_path, conf, job_type
+            FROM frames_old
+        """)).rowcount
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('frames', 'id'), COALESCE((SELECT max(id) FROM frames), 0) + 1, false)"
+        ))
+
+    print(f"✅ Скопировано строк: {copied}. Старые данные остались в frames_old.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Сворачивание старых кадров в часовые агрегаты и удаление сырых данных.
+
+Кадры старше FRAMES_RETENTION_DAYS досчитываются в frames_hourly (из неё
+работает /api/stats) и удаляются из frames; устаревшие месячные партиции
+удаляются целиком. Папки миниатюр images/ старше IMAGES_RETENTION_DAYS
+удаляются с диска. Отчёт по присутствию берётся из presence_intervals и
+не страдает. Запускать раз в сутки (cron / systemd timer).
+"""
+import os
+
+from database import engine
+from services.retention import frames_cutoff, images_cutoff, purge_frames, purge_images
+
+IMAGES_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")  # как в detect.py
+
+
+def main():
+    cutoff = frames_cutoff()
+    print(f"Кадры до {cutoff:%d.%m.%Y}: агрегация в frames_hourly и удаление")
+    deleted = purge_frames(engine, cutoff)
+
+    img_cutoff = images_cutoff()
+    print(f"Миниатюры до {img_cutoff:%d.%m.%Y}: удаление")
+    folders = purge_images(IMAGES_ROOT, img_cutoff)
+
+    print(f"✅ Удалено строк frames: {deleted}, папок миниатюр: {folders}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,124 +1,117 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
 import models, schemas
-import time
-from fastapi.responses import StreamingResponse
-
-import cv2
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-import io
+from services.capture import capture_manager
+from services.broadcast import broadcast_manager, mjpeg_stream
+from services.http_cache import not_modified, snapshot_etag, snapshot_headers
+from services.imaging import render_jpeg
+from services.placeholder import camera_placeholder
+from settings import settings
+from fastapi.responses import Response, StreamingResponse
+from typing import Optional
 
 router = APIRouter(prefix="/cameras", tags=["Cameras"])
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-def mjpeg_generator(rtsp_url: str):
-    cap = cv2.VideoCapture(rtsp_url)
-    if not cap.isOpened():
-        # бесконечный поток "заглушек"
-        while True:
-            img = Image.new("RGB", (640, 480), color=(200, 200, 200))
-            draw = ImageDraw.Draw(img)
-            text = "Cant connect to: " + rtsp_url
-            draw.text((100, 220), text, fill=(255, 0, 0), font_size=20)
-            _, jpeg = cv2.imencode(".jpg", np.array(img))
-            frame = jpeg.tobytes()
-            yield (b"--frame\r\n"
-                   b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
-            time.sleep(1)  # каждая секунда
-    else:
-        while True:
-            success, frame = cap.read()
-            if not success:
-                # если камера внезапно отвалилась — продолжаем заглушками
-                img = Image.new("RGB", (640, 480), color=(200, 200, 200))
-                draw = ImageDraw.Draw(img)
-                text = "Cant connect to: " + rtsp_url
-                draw.text((100, 220), text, fill=(255, 0, 0), font_size=20)
-                _, jpeg = cv2.imencode(".jpg", np.array(img))
-                frame = jpeg.tobytes()
-                yield (b"--frame\r\n"
-                       b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
-                # time.sleep(1)
-                continue
+def mjpeg_generator(camera_id: int, rtsp_url: str, fps: float = None,
+                    width: int = None, height: int = None, quality: int = None):
+    def encode(frame):
+        return render_jpeg(frame, width, height, quality)
 
-            _, jpeg = cv2.imencode(".jpg", frame)
-            frame = jpeg.tobytes()
-            yield (b"--frame\r\n"
-                   b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+    # один энкодер на камеру и размер/качество картинки для всех зрителей
+    return mjpeg_stream(("camera", camera_id, width, height, quality), camera_id, rtsp_url,
+                        encode, lambda: camera_placeholder(camera_id, rtsp_url, width, height), fps=fps)
 
-    cap.release()
 @router.get("/{camera_id}/stream")
-def stream_camera(camera_id: int, db: Session = Depends(get_db)):
-    cam = db.query(models.Camera).filter(models.Camera.id == camera_id).first()
+async def stream_camera(camera_id: int, fps: float = Query(settings.STREAM_FPS, gt=0, le=settings.STREAM_FPS_MAX),
+                        width: Optional[int] = Query(None, ge=16, le=7680),
+                        height: Optional[int] = Query(None, ge=16, le=4320),
+                        quality: Optional[int] = Query(None, ge=10, le=100),
+                        db: AsyncSession = Depends(get_db)):
+    cam = await db.get(models.Camera, camera_id)
     if not cam:
         raise HTTPException(status_code=404, detail="Camera not found")
 
+    # трансляция длится долго — соединение с базой возвращаем в пул сразу
+    await db.close()
     return StreamingResponse(
-        mjpeg_generator(cam.rtsp_url),
+        mjpeg_generator(cam.id, cam.rtsp_url, fps, width, height, quality),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
 @router.get("/", response_model=list[schemas.CameraOut])
-def list_cameras(db: Session = Depends(get_db)):
-    return db.query(models.Camera).all()
+async def list_cameras(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(models.Camera))
+    return result.scalars().all()
 
 @router.post("/", response_model=schemas.CameraOut)
-def create_camera(payload: schemas.CameraCreate, db: Session = Depends(get_db)):
+async def create_camera(payload: schemas.CameraCreate, db: AsyncSession = Depends(get_db)):
     cam = models.Camera(**payload.dict())
     db.add(cam)
-    db.commit()
-    db.refresh(cam)
+    await db.commit()
+    await db.refresh(cam)
     return cam
 
 @router.put("/{camera_id}", response_model=schemas.CameraOut)
-def update_camera(camera_id: int, payload: schemas.CameraCreate, db: Session = Depends(get_db)):
-    cam = db.query(models.Camera).filter(models.Camera.id == camera_id).first()
+async def update_camera(camera_id: int, payload: schemas.CameraCreate, db: AsyncSession = Depends(get_db)):
+    cam = await db.get(models.Camera, camera_id)
     if not cam:
         raise HTTPException(status_code=404, detail="Camera not found")
     for key, value in payload.dict().items():
         setattr(cam, key, value)
-    db.commit()
-    db.refresh(cam)
+    await db.commit()
+    await db.refresh(cam)
+    # RTSP мог измениться — поток захвата пересоздастся при следующем обращении
+    capture_manager.stop(camera_id)
+    broadcast_manager.stop_camera(camera_id)
     return cam
 
 @router.delete("/{camera_id}")
-def delete_camera(camera_id: int, db: Session = Depends(get_db)):
-    cam = db.query(models.Camera).filter(models.Camera.id == camera_id).first()
+async def delete_camera(camera_id: int, db: AsyncSession = Depends(get_db)):
+    cam = await db.get(models.Camera, camera_id)
     if not cam:
         raise HTTPException(status_code=404, detail="Camera not found")
-    db.delete(cam)
-    db.commit()
+    await db.delete(cam)
+    await db.commit()
+    capture_manager.stop(camera_id)
+    broadcast_manager.stop_camera(camera_id)
     return {"ok": True}
 
 @router.get("/{camera_id}/snapshot")
-def get_snapshot(camera_id: int, db: Session = Depends(get_db)):
-    cam = db.query(models.Camera).filter(models.Camera.id == camera_id).first()
+async def get_snapshot(camera_id: int,
+                       request: Request,
+                       width: Optional[int] = Query(None, ge=16, le=7680),
+                       height: Optional[int] = Query(None, ge=16, le=4320),
+                       quality: Optional[int] = Query(None, ge=10, le=100),
+                       db: AsyncSession = Depends(get_db)):
+    cam = await db.get(models.Camera, camera_id)
     if not cam:
         raise HTTPException(status_code=404, detail="Camera not found")
 
-    cap = cv2.VideoCapture(cam.rtsp_url)
-    success, frame = cap.read()
-    cap.release()
+    if capture_manager.is_down(cam.id, cam.rtsp_url):
+        # камера в ошибке — сразу заглушка из кэша, без потока из пула
+        ts, frame = None, None
+    else:
+        # ожидание первого кадра блокирующее — уводим из event loop
+        ts, frame = await run_in_threadpool(capture_manager.latest, cam.id, cam.rtsp_url)
+
+    if frame is None:
+        # если не удалось подключиться → готовая заглушка со статусом камеры
+        return Response(content=camera_placeholder(cam.id, cam.rtsp_url, width, height), media_type="image/jpeg",
+                        headers={"Cache-Control": "no-cache"})
 
-    if not success or frame is None:
-        # если не удалось подключиться → генерим картинку с текстом
-        img = Image.new("RGB", (640, 480), color=(200, 200, 200))
-        draw = ImageDraw.Draw(img)
-        text = "Cant connect to: " + cam.rtsp_url
-        draw.text((100, 220), text, fill=(255, 0, 0), font_size=20)
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG")
-        buf.seek(0)
-        return StreamingResponse(buf, media_type="image/jpeg")
+    # тот же кадр у клиента уже есть — 304 без кодирования
+    etag = snapshot_etag("cam", cam.id, int(ts * 1000), width, height, quality)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
 
-    # если удалось подключиться → отдаем кадр
-    _, encoded = cv2.imencode(".jpg", frame)
-    return StreamingResponse(io.BytesIO(encoded.tobytes()), media_type="image/jpeg")
\ No newline at end of file
+    # если удалось подключиться → отдаем кадр, уменьшенный до кодирования
+    jpeg = await run_in_threadpool(render_jpeg, frame, width, height, quality)
+    return Response(content=jpeg, media_type="image/jpeg", headers=snapshot_headers(etag))
\ No newline at end of file
@@ -1,24 +1,159 @@
-from fastapi import APIRouter, Depends, Response, Query
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from settings import settings
 import models
+from datetime import datetime
+from typing import List, Optional
 import csv, io
 
 router = APIRouter(prefix='/api/export', tags=['export'])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+F = models.Frame
+COLUMNS = [F.id, F.workstation_id, F.captured_at, F.trigger, F.people_count, F.conf, F.job_type, F.thumb_path]
+HEADER = [c.key for c in COLUMNS]
 
-@router.get('/events.csv')
-def export_csv(db: Session = Depends(get_db), limit: int = Query(1000, ge=1, le=10000)):
-    rows = db.query(models.Frame).order_by(models.Frame.captured_at.desc()).limit(limit).all()
+
+def build_query(workstation_id, start, end, limit):
+    query = select(*COLUMNS)
+    if workstation_id:
+        query = query.where(F.workstation_id.in_(workstation_id))
+    if start is not None:
+        query = query.where(F.captured_at >= start)
+    if end is not None:
+        query = query.where(F.captured_at < end)
+    query = query.order_by(F.captured_at.desc(), F.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def iter_chunks(query):
+    """Строки выгрузки пачками по EXPORT_CHUNK_ROWS через серверный курсор.
+
+    Сессия открывается внутри генератора: она живёт, пока клиент читает ответ.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.EXPORT_CHUNK_ROWS))
+        async for rows in result.partitions():
+            yield rows
+
+
+async def csv_stream(query):
     output = io.StringIO()
     writer = csv.writer(output)
-    writer.writerow(['id','workstation_id','captured_at','trigger','people_count','thumb_path'])
-    for r in rows:
-        writer.writerow([r.id, r.workstation_id, r.captured_at, r.trigger, r.people_count, r.thumb_path])
-    return Response(content=output.getvalue(), media_type='text/csv')
+    writer.writerow(HEADER)
+    async for rows in iter_chunks(query):
+        writer.writerows(rows)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    if output.tell():
+        yield output.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файл для pyarrow: записанные байты копятся до следующего take()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        b = bytes(b)
+        self.chunks.append(b)
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.pos
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=501, detail="pyarrow is not installed")
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('workstation_id', pa.int32()),
+        ('captured_at', pa.timestamp('us', tz='UTC')),
+        ('trigger', pa.string()),
+        ('people_count', pa.int32()),
+        ('conf', pa.int32()),
+        ('job_type', pa.int32()),
+        ('thumb_path', pa.string()),
+    ])
+    return pa, schema
+
+
+def _batch(pa, schema, rows):
+    columns = list(zip(*rows))
+    return pa.record_batch([pa.array(col, type=f.type) for col, f in zip(columns, schema)], schema=schema)
+
+
+async def arrow_stream(query, parquet):
+    """Parquet (row group на пачку) или Arrow IPC stream — по мере чтения курсора."""
+    pa, schema = _arrow()
+    sink = _ChunkSink()
+    if parquet:
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    async for rows in iter_chunks(query):
+        writer.write_batch(_batch(pa, schema, rows))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def export_response(stream, media_type, filename):
+    return StreamingResponse(
+        stream, media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get('/events.csv')
+async def export_csv(
+    workstation_id: Optional[List[int]] = Query(None),
+    start: Optional[datetime] = Query(None, description="captured_at >= start"),
+    end: Optional[datetime] = Query(None, description="captured_at < end"),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    query = build_query(workstation_id, start, end, limit)
+    return export_response(csv_stream(query), 'text/csv', 'events.csv')
+
+
+@router.get('/events.parquet')
+async def export_parquet(
+    workstation_id: Optional[List[int]] = Query(None),
+    start: Optional[datetime] = Query(None, description="captured_at >= start"),
+    end: Optional[datetime] = Query(None, description="captured_at < end"),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    _arrow()  # 501 до начала ответа, если pyarrow нет
+    query = build_query(workstation_id, start, end, limit)
+    return export_response(arrow_stream(query, parquet=True), 'application/vnd.apache.parquet', 'events.parquet')
+
+
+@router.get('/events.arrow')
+async def export_arrow(
+    workstation_id: Optional[List[int]] = Query(None),
+    start: Optional[datetime] = Query(None, description="captured_at >= start"),
+    end: Optional[datetime] = Query(None, description="captured_at < end"),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    _arrow()
+    query = build_query(workstation_id, start, end, limit)
+    return export_response(arrow_stream(query, parquet=False), 'application/vnd.apache.arrow.stream', 'events.arrow')
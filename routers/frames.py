@@ -1,17 +1,71 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from database import SessionLocal
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
 import models, schemas
 
 router = APIRouter(prefix='/api/frames', tags=['frames'])
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-@router.get('/', response_model=list[schemas.FrameOut])
-def recent_frames(db: Session = Depends(get_db), limit: int = Query(100, ge=1, le=1000)):
-    return db.query(models.Frame).order_by(models.Frame.captured_at.desc()).limit(limit).all()
+def encode_cursor(frame: models.Frame) -> str:
+    raw = json.dumps([frame.captured_at.isoformat(), frame.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        captured_at, frame_id = json.loads(raw)
+        return datetime.fromisoformat(captured_at), int(frame_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get('/', response_model=schemas.FramePage)
+async def list_frames(
+    db: AsyncSession = Depends(get_db),
+    workstation_id: Optional[List[int]] = Query(None),
+    start: Optional[datetime] = Query(None, description="captured_at >= start"),
+    end: Optional[datetime] = Query(None, description="captured_at < end"),
+    min_people: Optional[int] = Query(None, ge=0),
+    max_people: Optional[int] = Query(None, ge=0),
+    min_conf: Optional[int] = Query(None, ge=0, le=100),
+    job_type: Optional[List[int]] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Кадры от новых к старым. Страницы — по ключу (captured_at, id), без OFFSET:
+    стоимость любой страницы одинакова (индексы frames с id после captured_at)."""
+    F = models.Frame
+    query = select(F)
+    if workstation_id:
+        query = query.where(F.workstation_id.in_(workstation_id))
+    if start is not None:
+        query = query.where(F.captured_at >= start)
+    if end is not None:
+        query = query.where(F.captured_at < end)
+    if min_people is not None:
+        query = query.where(F.people_count >= min_people)
+    if max_people is not None:
+        query = query.where(F.people_count <= max_people)
+    if min_conf is not None:
+        query = query.where(F.conf >= min_conf)
+    if job_type:
+        query = query.where(F.job_type.in_(job_type))
+    if cursor:
+        ts, frame_id = decode_cursor(cursor)
+        # параметры с типами колонок (id — BIGINT), иначе asyncpg привяжет INTEGER
+        query = query.where(tuple_(F.captured_at, F.id) <
+                            tuple_(literal(ts, F.captured_at.type), literal(frame_id, F.id.type)))
+
+    # на одну строку больше — чтобы понять, есть ли следующая страница
+    query = query.order_by(F.captured_at.desc(), F.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).scalars().all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {'items': rows[:limit], 'next_cursor': next_cursor}
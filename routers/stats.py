@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+import models, schemas
+
+router = APIRouter(prefix='/api/stats', tags=['stats'])
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def stats_row(r):
+    frames = r.frames or 0
+    minutes = r.minutes or 0
+
+    def job_minutes(n):
+        # время занятия — доля кадров с этим job_type от наблюдаемых минут
+        return round(minutes * n / frames, 1) if frames else 0.0
+
+    return {
+        'workstation_id': r.workstation_id,
+        'bucket': getattr(r, 'bucket', None),
+        'frames': frames,
+        'minutes': minutes,
+        'present_minutes': r.present_minutes or 0,
+        'present_pct': round(100.0 * r.present_minutes / minutes, 1) if minutes else 0.0,
+        'mean_conf': round(r.conf_sum / r.present_frames, 1) if r.present_frames else None,
+        'max_conf': r.max_conf or 0,
+        'work_min': job_minutes(r.job_work),
+        'phone_min': job_minutes(r.job_phone),
+        'other_min': job_minutes(r.job_other),
+    }
+
+@router.get('/', response_model=list[schemas.StatsRow])
+async def workstation_stats(
+    db: AsyncSession = Depends(get_db),
+    bucket: str = Query('day', pattern='^(hour|day|total)$'),
+    workstation_id: Optional[List[int]] = Query(None),
+    start: Optional[datetime] = Query(None, description="hour >= start"),
+    end: Optional[datetime] = Query(None, description="hour < end"),
+):
+    """Присутствие и активность по рабочим местам из часовых агрегатов frames_hourly."""
+    H = models.FrameHourly
+    keys = [H.workstation_id]
+    if bucket == 'hour':
+        keys.append(H.hour.label('bucket'))
+    elif bucket == 'day':
+        keys.append(func.date_trunc('day', H.hour).label('bucket'))
+
+    query = select(
+        *keys,
+        func.sum(H.frames).label('frames'),
+        func.sum(H.present_frames).label('present_frames'),
+        func.sum(H.minutes).label('minutes'),
+        func.sum(H.present_minutes).label('present_minutes'),
+        func.sum(H.conf_sum).label('conf_sum'),
+        func.max(H.conf_max).label('max_conf'),
+        func.sum(H.job_other).label('job_other'),
+        func.sum(H.job_phone).label('job_phone'),
+        func.sum(H.job_work).label('job_work'),
+    )
+    if workstation_id:
+        query = query.where(H.workstation_id.in_(workstation_id))
+    if start is not None:
+        query = query.where(H.hour >= start)
+    if end is not None:
+        query = query.where(H.hour < end)
+    query = query.group_by(*keys).order_by(*keys)
+
+    rows = (await db.execute(query)).all()
+    return [stats_row(r) for r in rows]
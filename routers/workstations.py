@@ -1,166 +1,171 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
 import models, schemas
-import time
-from fastapi.responses import StreamingResponse
+from services.capture import capture_manager
+from services.geometry import geometry_cache, geometry_hash
+from services.http_cache import not_modified, snapshot_etag, snapshot_headers
+from services.imaging import encode_jpeg, render_jpeg, resize
+from services.placeholder import camera_placeholder
+from services.broadcast import mjpeg_stream
+from settings import settings
+from fastapi.responses import Response, StreamingResponse
+from typing import Optional
 import cv2
-import numpy as np
-from PIL import Image, ImageDraw
-import io
 
 router = APIRouter(prefix="/workstations", tags=["Workstations"])
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
-def mjpeg_generator(rtsp_url: str, x:int, y:int, w:int, h:int):
-    cap = cv2.VideoCapture(rtsp_url)
-
-
-    if not cap.isOpened():
-        # бесконечный поток "заглушек"
-        while True:
-            img = Image.new("RGB", (640, 480), color=(200, 200, 200))
-            draw = ImageDraw.Draw(img)
-            text = "Cant connect to: " + rtsp_url
-            draw.text((100, 220), text, fill=(255, 0, 0), font_size=20)
-            _, jpeg = cv2.imencode(".jpg", np.array(img))
-            frame = jpeg.tobytes()
-            yield (b"--frame\r\n"
-                   b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
-            time.sleep(1)  # каждая секунда
-    else:
-        while True:
-            success, frame = cap.read()
-            if not success:
-                # если камера внезапно отвалилась — продолжаем заглушками
-                img = Image.new("RGB", (640, 480), color=(200, 200, 200))
-                draw = ImageDraw.Draw(img)
-                text = "Cant connect to: " + rtsp_url
-                draw.text((100, 220), text, fill=(255, 0, 0), font_size=20)
-
-
-                _, jpeg = cv2.imencode(".jpg", np.array(img))
-                frame = jpeg.tobytes()
-                yield (b"--frame\r\n"
-                       b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
-                # time.sleep(1)
-                continue
-
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
-            _, jpeg = cv2.imencode(".jpg", frame)
-            frame = jpeg.tobytes()
-            yield (b"--frame\r\n"
-                   b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
-
-    cap.release()
+
+def render_ws_frame(frame, geom, roi_only=False, width=None, height=None, quality=None, draw_roi=True):
+    """JPEG рабочего места: вырезанный ROI или кадр с рамкой; уменьшение до кодирования."""
+    if roi_only:
+        roi = geom.crop(frame)
+        return render_jpeg(roi if roi.size else frame, width, height, quality)
+
+    # кадр общий для всех зрителей — рамку рисуем на уменьшенной копии
+    img, scale = resize(frame, width, height)
+    if draw_roi:
+        if img is frame:
+            img = frame.copy()
+        x, y = round(geom.x * scale), round(geom.y * scale)
+        w, h = round(geom.w * scale), round(geom.h * scale)
+        cv2.rectangle(img, (x, y), (x + w, y + h), (0, 0, 255), 2)
+    return encode_jpeg(img, quality)
+
+def mjpeg_generator(camera_id: int, rtsp_url: str, ws, fps: float = None,
+                    roi_only: bool = False, width: int = None, height: int = None, quality: int = None):
+    geom = geometry_cache.get(ws)
+
+    def encode(frame):
+        return render_ws_frame(frame, geom, roi_only, width, height, quality)
+
+    # трансляция общая для всех зрителей мест с той же геометрией и параметрами картинки
+    key = ("roi", camera_id, geometry_hash(ws), roi_only, width, height, quality)
+    return mjpeg_stream(key, camera_id, rtsp_url,
+                        encode, lambda: camera_placeholder(camera_id, rtsp_url, width, height), fps=fps)
 
 # 🔹 Создать рабочее место
 @router.post("/", response_model=schemas.WorkstationOut)
-def create_ws(payload: schemas.WorkstationCreate, db: Session = Depends(get_db)):
+async def create_ws(payload: schemas.WorkstationCreate, db: AsyncSession = Depends(get_db)):
     ws = models.Workstation(**payload.dict())
     db.add(ws)
-    db.commit()
-    db.refresh(ws)
+    await db.commit()
+    await db.refresh(ws)
 
     # ensure presence state
     from models import PresenceState
-    if not db.query(PresenceState).filter_by(workstation_id=ws.id).first():
+    result = await db.execute(select(PresenceState).filter_by(workstation_id=ws.id))
+    if not result.scalars().first():
         ps = PresenceState(workstation_id=ws.id, is_present=False)
         db.add(ps)
-        db.commit()
+        await db.commit()
 
     return ws
 
 # 🔹 Список всех рабочих мест
 @router.get("/", response_model=list[schemas.WorkstationOut])
-def list_ws(db: Session = Depends(get_db)):
-    return db.query(models.Workstation).all()
+async def list_ws(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(models.Workstation))
+    return result.scalars().all()
 
 # 🔹 Получить одно рабочее место
 @router.get("/{ws_id}", response_model=schemas.WorkstationOut)
-def get_ws(ws_id: int, db: Session = Depends(get_db)):
-    ws = db.query(models.Workstation).filter(models.Workstation.id == ws_id).first()
+async def get_ws(ws_id: int, db: AsyncSession = Depends(get_db)):
+    ws = await db.get(models.Workstation, ws_id)
     if not ws:
         raise HTTPException(status_code=404, detail="Workstation not found")
     return ws
 
 # 🔹 Обновить рабочее место
 @router.put("/{ws_id}", response_model=schemas.WorkstationOut)
-def update_ws(ws_id: int, payload: schemas.WorkstationCreate, db: Session = Depends(get_db)):
-    ws = db.query(models.Workstation).filter(models.Workstation.id == ws_id).first()
+async def update_ws(ws_id: int, payload: schemas.WorkstationCreate, db: AsyncSession = Depends(get_db)):
+    ws = await db.get(models.Workstation, ws_id)
     if not ws:
         raise HTTPException(status_code=404, detail="Workstation not found")
 
     for key, value in payload.dict().items():
         setattr(ws, key, value)
 
-    db.commit()
-    db.refresh(ws)
+    await db.commit()
+    await db.refresh(ws)
+    # полигон мог измениться — сбрасываем закэшированную маску
+    geometry_cache.invalidate(ws_id)
     return ws
 
 # 🔹 Удалить рабочее место
 @router.delete("/{ws_id}")
-def delete_ws(ws_id: int, db: Session = Depends(get_db)):
-    ws = db.query(models.Workstation).filter(models.Workstation.id == ws_id).first()
+async def delete_ws(ws_id: int, db: AsyncSession = Depends(get_db)):
+    ws = await db.get(models.Workstation, ws_id)
     if not ws:
         raise HTTPException(status_code=404, detail="Workstation not found")
 
-    db.delete(ws)
-    db.commit()
+    await db.delete(ws)
+    await db.commit()
+    geometry_cache.invalidate(ws_id)
     return {"ok": True}
 
 @router.get("/{ws_id}/snapshot")
-def get_ws_snapshot(ws_id: int, db: Session = Depends(get_db)):
-    ws = db.query(models.Workstation).filter(models.Workstation.id == ws_id).first()
+async def get_ws_snapshot(ws_id: int,
+                          request: Request,
+                          roi_only: bool = False,
+                          width: Optional[int] = Query(None, ge=16, le=7680),
+                          height: Optional[int] = Query(None, ge=16, le=4320),
+                          quality: Optional[int] = Query(None, ge=10, le=100),
+                          db: AsyncSession = Depends(get_db)):
+    ws = await db.get(models.Workstation, ws_id)
     if not ws:
         raise HTTPException(status_code=404, detail="Workstation not found")
 
-    cam = db.query(models.Camera).filter(models.Camera.id == ws.camera_id).first()
+    cam = await db.get(models.Camera, ws.camera_id)
     if not cam:
         raise HTTPException(status_code=404, detail="Camera not found")
 
-    cap = cv2.VideoCapture(cam.rtsp_url)
-    success, frame = cap.read()
-    cap.release()
-
-    if not success or frame is None:
-        # Заглушка
-        img = Image.new("RGB", (640, 480), color=(200, 200, 200))
-        draw = ImageDraw.Draw(img)
-
-        text = "Cant connect to: " + cam.rtsp_url
-        draw.text((100, 220), text, fill=(255, 0, 0), font_size=20)
+    if capture_manager.is_down(cam.id, cam.rtsp_url):
+        # камера в ошибке — сразу заглушка из кэша, без потока из пула
+        ts, frame = None, None
+    else:
+        # ожидание первого кадра блокирующее — уводим из event loop
+        ts, frame = await run_in_threadpool(capture_manager.latest, cam.id, cam.rtsp_url)
 
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG")
-        buf.seek(0)
-        return StreamingResponse(buf, media_type="image/jpeg")
+    if frame is None:
+        # Заглушка — из кэша, со статусом камеры
+        return Response(content=camera_placeholder(cam.id, cam.rtsp_url, width, height), media_type="image/jpeg",
+                        headers={"Cache-Control": "no-cache"})
 
-    # Рисуем красный прямоугольник (x, y, w, h)
-    # x, y, w, h = ws.x, ws.y, ws.w, ws.h
-    # cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
+    # тот же кадр у клиента уже есть — 304 без кодирования
+    etag = snapshot_etag("ws", ws.id, int(ts * 1000), geometry_hash(ws) if roi_only else None, width, height, quality)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
 
-    # Кодируем и возвращаем как JPEG
-    _, encoded = cv2.imencode(".jpg", frame)
-    return StreamingResponse(io.BytesIO(encoded.tobytes()), media_type="image/jpeg")
+    # Кодируем и возвращаем как JPEG (весь кадр без рамки или только ROI)
+    geom = geometry_cache.get(ws)
+    jpeg = await run_in_threadpool(render_ws_frame, frame, geom, roi_only, width, height, quality, False)
+    return Response(content=jpeg, media_type="image/jpeg", headers=snapshot_headers(etag))
 
 @router.get("/{ws_id}/stream")
-def stream_camera(ws_id: int, db: Session = Depends(get_db)):
-    ws = db.query(models.Workstation).filter(models.Workstation.id == ws_id).first()
+async def stream_camera(ws_id: int, fps: float = Query(settings.STREAM_FPS, gt=0, le=settings.STREAM_FPS_MAX),
+                        roi_only: bool = False,
+                        width: Optional[int] = Query(None, ge=16, le=7680),
+                        height: Optional[int] = Query(None, ge=16, le=4320),
+                        quality: Optional[int] = Query(None, ge=10, le=100),
+                        db: AsyncSession = Depends(get_db)):
+    ws = await db.get(models.Workstation, ws_id)
     if not ws:
         raise HTTPException(status_code=404, detail="Workstation not found")
 
-    cam = db.query(models.Camera).filter(models.Camera.id == ws.camera_id).first()
+    cam = await db.get(models.Camera, ws.camera_id)
     if not cam:
         raise HTTPException(status_code=404, detail="Camera not found")
 
+    # трансляция длится долго — соединение с базой возвращаем в пул сразу
+    await db.close()
     return StreamingResponse(
-        mjpeg_generator(cam.rtsp_url, ws.x, ws.y, ws.w, ws.h),
+        mjpeg_generator(cam.id, cam.rtsp_url, ws, fps, roi_only, width, height, quality),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
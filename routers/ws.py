@@ -1,43 +1,155 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List
-from database import SessionLocal
-import models
+import asyncio
 import json
+from typing import Dict
+
+import asyncpg
+from fastapi import APIRouter, WebSocket
+
+from services.presence import PRESENCE_CHANNEL, presence_item
+from settings import settings
 
 router = APIRouter()
 
+
+class Client:
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+    def put(self, text: str) -> bool:
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            # клиент не успевает читать — освобождаем очередь и ставим маркер отключения
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active: List[WebSocket] = []
+    """Рассылка изменений присутствия: у каждого клиента своя ограниченная очередь,
+    медленный клиент отключается и не задерживает остальных."""
 
-    async def connect(self, websocket: WebSocket):
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.active: Dict[WebSocket, Client] = {}
+        self.snapshot: Dict[int, dict] = {}  # workstation_id -> текущее состояние
+
+    async def connect(self, websocket: WebSocket) -> Client:
         await websocket.accept()
-        self.active.append(websocket)
+        client = Client(websocket, self.queue_size)
+        self.active[websocket] = client
+        client.put(self.snapshot_text())
+        return client
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active:
-            self.active.remove(websocket)
+        self.active.pop(websocket, None)
+
+    def snapshot_text(self) -> str:
+        return json.dumps({'type': 'snapshot', 'items': list(self.snapshot.values())}, default=str)
+
+    def publish(self, text: str):
+        for websocket, client in list(self.active.items()):
+            if not client.put(text):
+                print("⚠️ ws: клиент не успевает читать — отключаем")
+                self.disconnect(websocket)
 
     async def broadcast(self, message: dict):
-        text = json.dumps(message, default=str)
-        for conn in list(self.active):
-            try:
-                await conn.send_text(text)
-            except Exception:
-                self.disconnect(conn)
+        self.publish(json.dumps(message, default=str))
+
+    def set_snapshot(self, items):
+        self.snapshot = {d['workstation_id']: d for d in items}
+        self.publish(self.snapshot_text())
+
+    def apply(self, deltas):
+        for d in deltas:
+            self.snapshot[d['workstation_id']] = d
+        self.publish(json.dumps({'type': 'delta', 'items': deltas}, default=str))
+
+
+manager = ConnectionManager(settings.WS_QUEUE_SIZE)
+_listener_task = None
+
+
+def _on_notify(conn, pid, channel, payload):
+    try:
+        manager.apply(json.loads(payload))
+    except Exception as e:
+        print(f"⚠️ ws: не удалось разобрать уведомление: {e}")
+
+
+async def listen_presence():
+    """LISTEN на изменения от detect.py; снимок presence_state читается один раз при подключении."""
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(settings.POSTGRES_DSN)
+            # сначала подписка, потом снимок — изменения между ними не потеряются
+            await conn.add_listener(PRESENCE_CHANNEL, _on_notify)
+            rows = await conn.fetch("SELECT workstation_id, is_present, last_seen FROM presence_state")
+            manager.set_snapshot([presence_item(**dict(r)) for r in rows])
+            print("✅ ws: подписка на изменения присутствия")
+            while not conn.is_closed():
+                await asyncio.sleep(settings.PRESENCE_LISTEN_RECONNECT_S)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ ws: ошибка LISTEN {PRESENCE_CHANNEL}: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(settings.PRESENCE_LISTEN_RECONNECT_S)
+
+
+def start_presence_listener():
+    global _listener_task
+    if _listener_task is None or _listener_task.done():
+        _listener_task = asyncio.create_task(listen_presence())
+
+
+async def stop_presence_listener():
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
+
+
+async def _send_loop(client: Client):
+    while True:
+        text = await client.queue.get()
+        if text is None:
+            return
+        await asyncio.wait_for(client.websocket.send_text(text), settings.WS_SEND_TIMEOUT_S)
+
+
+async def _receive_loop(client: Client):
+    while True:
+        await client.websocket.receive_text()  # ping или запрос — отвечаем снимком из памяти
+        client.put(manager.snapshot_text())
 
-manager = ConnectionManager()
 
 @router.websocket('/ws/presence')
 async def presence_ws(websocket: WebSocket):
-    await manager.connect(websocket)
+    client = await manager.connect(websocket)
+    tasks = [asyncio.create_task(_send_loop(client)), asyncio.create_task(_receive_loop(client))]
     try:
-        while True:
-            data = await websocket.receive_text()  # ping-pong or client requests
-            # reply current presence snapshot
-            with SessionLocal() as db:
-                rows = db.query(models.PresenceState).all()
-                payload = [{'workstation_id':r.workstation_id,'is_present':r.is_present,'last_seen':r.last_seen} for r in rows]
-            await websocket.send_text(json.dumps(payload, default=str))
-    except WebSocketDisconnect:
+        # завершается по отключению клиента, ошибке/таймауту отправки или переполнению очереди
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
         manager.disconnect(websocket)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if client.dropped:
+            try:
+                await websocket.close(code=1013)
+            except Exception:
+                pass
@@ -41,3 +41,20 @@ class FrameOut(BaseModel):
     model_config = {
         "from_attributes": True
     }
+
+class FramePage(BaseModel):
+    items: List[FrameOut]
+    next_cursor: Optional[str] = None  # None — страниц больше нет
+
+class StatsRow(BaseModel):
+    workstation_id: int
+    bucket: Optional[datetime] = None  # начало часа/дня; None для bucket=total
+    frames: int
+    minutes: int                       # минуты, за которые есть кадры
+    present_minutes: int
+    present_pct: float
+    mean_conf: Optional[float]         # средний conf по кадрам с человеком
+    max_conf: int
+    work_min: float                    # оценка времени по job_type
+    phone_min: float
+    other_min: float
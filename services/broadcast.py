@@ -0,0 +1,209 @@
+# Общая MJPEG-трансляция: кадр камеры кодируется в JPEG один раз и раздаётся всем зрителям
+import asyncio
+import threading
+
+from services.capture import capture_manager
+
+
+def mjpeg_part(jpeg):
+    """Одна часть multipart/x-mixed-replace; boundary=frame."""
+    return (b"--frame\r\n"
+            b"Content-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n")
+
+
+class Subscriber:
+    """Слот зрителя на один кадр: новый JPEG вытесняет непрочитанный старый.
+
+    Живёт в event loop ответа; поток трансляции пишет в него через call_soon_threadsafe.
+    """
+
+    def __init__(self, loop, fps=None):
+        self.fps = fps
+        self.seq = 0
+        self.jpeg = None
+        self.closed = False
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def _set(self, jpeg):
+        self.seq += 1
+        self.jpeg = jpeg
+        self._event.set()
+
+    def _close(self):
+        self.closed = True
+        self._event.set()
+
+    def _call(self, fn, *args):
+        try:
+            self._loop.call_soon_threadsafe(fn, *args)
+        except RuntimeError:
+            pass  # event loop уже закрыт
+
+    def put(self, jpeg):
+        self._call(self._set, jpeg)
+
+    def close(self):
+        self._call(self._close)
+
+    async def get(self, after_seq=0, timeout=None):
+        """Ждёт кадр новее after_seq; возвращает (seq, jpeg) или (after_seq, None) по таймауту/закрытию."""
+        while self.seq <= after_seq and not self.closed:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        if self.seq > after_seq:
+            return self.seq, self.jpeg
+        return after_seq, None
+
+
+class MjpegBroadcaster(threading.Thread):
+    """Поток трансляции одного вида камеры (кадр целиком или с рамкой рабочего места).
+
+    encode(frame) -> bytes JPEG, placeholder() -> bytes JPEG, пока камера недоступна.
+    """
+
+    def __init__(self, key, camera_id, rtsp_url, encode, placeholder):
+        super().__init__(name=f"mjpeg-{key}", daemon=True)
+        self.key = key
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.encode = encode
+        self.placeholder = placeholder
+        self.subscribers = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def add(self, sub):
+        with self._lock:
+            self.subscribers.add(sub)
+
+    def remove(self, sub):
+        """Убирает зрителя; возвращает True, если зрителей не осталось."""
+        with self._lock:
+            self.subscribers.discard(sub)
+            return not self.subscribers
+
+    def min_interval(self):
+        """Минимальный интервал между кадрами: кодируем не чаще, чем просит самый быстрый зритель."""
+        with self._lock:
+            rates = [sub.fps for sub in self.subscribers]
+        if not rates or any(not r for r in rates):
+            return 0
+        return 1.0 / max(rates)
+
+    def _publish(self, jpeg):
+        with self._lock:
+            subs = list(self.subscribers)
+        for sub in subs:
+            sub.put(jpeg)
+
+    def run(self):
+        worker = capture_manager.get(self.camera_id, self.rtsp_url)
+        last_ts = last_sent = None
+        while not self._stop_event.is_set():
+            # ждём кадр новее уже разосланного из общего потока захвата
+            ts, frame = worker.wait_frame(last_ts)
+            if self._stop_event.is_set():
+                break
+            if frame is None:
+                # камера недоступна — заглушка раз в секунду
+                self._publish(self.placeholder())
+                self._stop_event.wait(1)
+                # поток захвата мог завершиться — переподключаемся через менеджер
+                worker = capture_manager.get(self.camera_id, self.rtsp_url)
+                continue
+
+            # кадры чаще нужного зрителям пропускаем, не кодируя
+            interval = self.min_interval()
+            if interval and last_sent is not None and ts - last_sent < interval:
+                last_ts = ts
+                continue
+            last_ts = last_sent = ts
+            self._publish(self.encode(frame))
+
+    def stop(self):
+        self._stop_event.set()
+        # зрители остановленной трансляции завершают свои ответы
+        with self._lock:
+            subs = list(self.subscribers)
+        for sub in subs:
+            sub.close()
+
+
+class BroadcastManager:
+    """Реестр трансляций по ключу вида; трансляция живёт, пока есть хотя бы один зритель."""
+
+    def __init__(self):
+        self._broadcasters = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key, camera_id, rtsp_url, encode, placeholder, loop, fps=None):
+        sub = Subscriber(loop, fps)
+        with self._lock:
+            b = self._broadcasters.get(key)
+            if b is not None and (b.rtsp_url != rtsp_url or not b.is_alive()):
+                b.stop()
+                b = None
+            if b is None:
+                b = MjpegBroadcaster(key, camera_id, rtsp_url, encode, placeholder)
+                self._broadcasters[key] = b
+                b.add(sub)
+                b.start()
+            else:
+                b.add(sub)
+        return sub
+
+    def unsubscribe(self, key, sub):
+        sub.close()
+        with self._lock:
+            b = self._broadcasters.get(key)
+            if b is not None and b.remove(sub):
+                # последний зритель ушёл
+                b.stop()
+                del self._broadcasters[key]
+
+    def stop_camera(self, camera_id):
+        """Останавливает трансляции камеры (RTSP изменился или камера удалена)."""
+        with self._lock:
+            keys = [k for k, b in self._broadcasters.items() if b.camera_id == camera_id]
+            for k in keys:
+                self._broadcasters.pop(k).stop()
+
+    def stop_all(self):
+        with self._lock:
+            broadcasters = list(self._broadcasters.values())
+            self._broadcasters.clear()
+        for b in broadcasters:
+            b.stop()
+
+
+broadcast_manager = BroadcastManager()
+
+
+async def mjpeg_stream(key, camera_id, rtsp_url, encode, placeholder, fps=None, timeout=5):
+    """Асинхронный генератор частей MJPEG для одного зрителя общей трансляции key.
+
+    Не держит поток из пула: ждёт кадр в event loop. Следующая часть готовится
+    только после того, как сервер отправил предыдущую, — при заполненном буфере
+    сокета клиента кадры не копятся, а заменяют друг друга в слоте. fps — не чаще.
+    """
+    loop = asyncio.get_running_loop()
+    sub = broadcast_manager.subscribe(key, camera_id, rtsp_url, encode, placeholder, loop, fps)
+    interval = 1.0 / fps if fps else 0
+    try:
+        seq = 0
+        while True:
+            seq, jpeg = await sub.get(seq, timeout)
+            if jpeg is None:
+                if sub.closed:
+                    return
+                continue
+            sent_at = loop.time()
+            yield mjpeg_part(jpeg)
+            if interval:
+                await asyncio.sleep(max(0.0, sent_at + interval - loop.time()))
+    finally:
+        broadcast_manager.unsubscribe(key, sub)
@@ -0,0 +1,228 @@
+# Долгоживущие потоки захвата: один декодер RTSP на камеру, последние кадры в кольцевом буфере
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from settings import settings
+
+
+def open_capture(rtsp_url):
+    """VideoCapture с таймаутами подключения и чтения, чтобы мёртвая камера не висела по умолчанию OpenCV."""
+    params = [
+        cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(settings.CAPTURE_OPEN_TIMEOUT_S * 1000),
+        cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(settings.CAPTURE_READ_TIMEOUT_S * 1000),
+    ]
+    return cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG, params)
+
+
+class CameraCapture(threading.Thread):
+    """Поток, который держит одно подключение к камере и складывает кадры в буфер."""
+
+    def __init__(self, camera_id, rtsp_url, buffer_size=None, reconnect_s=None, idle_timeout_s=None):
+        super().__init__(name=f"capture-{camera_id}", daemon=True)
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.reconnect_s = reconnect_s if reconnect_s is not None else settings.CAPTURE_RECONNECT_S
+        self.idle_timeout_s = idle_timeout_s if idle_timeout_s is not None else settings.CAPTURE_IDLE_TIMEOUT_S
+        # кольцевой буфер (timestamp, frame), самый свежий кадр — последний
+        self.frames = deque(maxlen=buffer_size or settings.CAPTURE_BUFFER_SIZE)
+        self.connected = False
+        self.last_error = None
+        self.last_frame_ts = None
+        self.last_access = time.monotonic()
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        failures = 0
+        while not self._stop_event.is_set() and not self._is_idle():
+            cap = open_capture(self.rtsp_url)
+            if not cap.isOpened():
+                self._set_error("connect")
+                cap.release()
+                failures += 1
+                self._stop_event.wait(self._backoff(failures))
+                continue
+
+            self.connected = True
+            self.last_error = None
+            while not self._stop_event.is_set() and not self._is_idle():
+                ok, frame = cap.read()
+                if not ok or frame is None:
+                    self._set_error("read")
+                    break
+                failures = 0
+                with self._cond:
+                    self.last_frame_ts = time.time()
+                    self.frames.append((self.last_frame_ts, frame))
+                    self._cond.notify_all()
+            cap.release()
+            self.connected = False
+            # подключение потеряно — старые кадры не отдаём как текущие
+            with self._cond:
+                self.frames.clear()
+                self._cond.notify_all()
+            if not self._stop_event.is_set():
+                failures += 1
+                self._stop_event.wait(self._backoff(failures))
+
+        self.connected = False
+        with self._cond:
+            self._cond.notify_all()
+
+    def _backoff(self, failures):
+        # мёртвая камера: паузы между переподключениями растут до CAPTURE_RECONNECT_MAX_S
+        return min(self.reconnect_s * 2 ** (failures - 1), settings.CAPTURE_RECONNECT_MAX_S)
+
+    def _is_idle(self):
+        return self.idle_timeout_s and time.monotonic() - self.last_access > self.idle_timeout_s
+
+    def _set_error(self, kind):
+        self.connected = False
+        self.last_error = kind
+        with self._cond:
+            self._cond.notify_all()
+
+    def touch(self):
+        self.last_access = time.monotonic()
+
+    def latest(self):
+        """Последний кадр (timestamp, frame) или (None, None). Кадр общий — не изменять на месте."""
+        self.touch()
+        with self._cond:
+            if not self.frames:
+                return None, None
+            return self.frames[-1]
+
+    def status(self):
+        """(время последнего кадра или None, последняя ошибка) — для заглушек UI."""
+        return self.last_frame_ts, self.last_error
+
+    def wait_frame(self, after_ts=None, timeout=None):
+        """Ждёт кадр новее after_ts; по таймауту возвращает (None, None).
+
+        Ждёт только живое или ещё подключающееся соединение: если камера уже
+        в ошибке и кадров нет, сразу возвращает (None, None), не тратя таймаут.
+        """
+        self.touch()
+        deadline = time.monotonic() + (timeout if timeout is not None else settings.CAPTURE_FIRST_FRAME_TIMEOUT_S)
+        with self._cond:
+            while True:
+                if self.frames and (after_ts is None or self.frames[-1][0] > after_ts):
+                    return self.frames[-1]
+                if self.last_error is not None and not self.frames:
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.is_alive():
+                    return None, None
+                self._cond.wait(remaining)
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+
+class CaptureManager:
+    """Реестр потоков захвата: не больше одного подключения к каждой камере на процесс."""
+
+    def __init__(self):
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def get(self, camera_id, rtsp_url):
+        with self._lock:
+            worker = self._workers.get(camera_id)
+            if worker is not None and (worker.rtsp_url != rtsp_url or not worker.is_alive()):
+                worker.stop()
+                worker = None
+            if worker is None:
+                worker = CameraCapture(camera_id, rtsp_url)
+                worker.start()
+                self._workers[camera_id] = worker
+            worker.touch()
+            return worker
+
+    def latest(self, camera_id, rtsp_url, timeout=None, max_age=None):
+        """Последний кадр камеры; при первом обращении ждёт подключения не дольше timeout.
+
+        Камера, уже известная как недоступная (ошибка и нет кадров), не ждётся.
+
+        Кадр старше max_age секунд (по умолчанию CAPTURE_STALE_S, 0 — без проверки)
+        считается отсутствующим: (None, None).
+        """
+        max_age = max_age if max_age is not None else settings.CAPTURE_STALE_S
+        worker = self.get(camera_id, rtsp_url)
+        ts, frame = worker.latest()
+        if frame is None:
+            ts, frame = worker.wait_frame(None, timeout)
+        if frame is not None and max_age and time.time() - ts > max_age:
+            return None, None
+        return ts, frame
+
+    def is_down(self, camera_id, rtsp_url):
+        """Камера уже известна как недоступная (ошибка и нет кадров): её кадр ждать не нужно.
+
+        Поток захвата при этом продолжает переподключаться.
+        """
+        worker = self.get(camera_id, rtsp_url)
+        return worker.last_error is not None and worker.latest()[1] is None
+
+    def status(self, camera_id):
+        """Статус потока захвата камеры, не запуская его: (last_ts, last_error)."""
+        worker = self._workers.get(camera_id)
+        if worker is None:
+            return None, None
+        return worker.status()
+
+    def fetch_many(self, cameras, timeout=None, max_age=None):
+        """Параллельно получает последние кадры камер в ограниченном пуле потоков.
+
+        Возвращает ({camera_id: frame}, {camera_id: причина}) — недоступные и
+        зависшие камеры (кадр старше max_age секунд) не задерживают остальные.
+        """
+        max_age = max_age if max_age is not None else settings.CAPTURE_STALE_S
+
+        def fetch(camera):
+            # возраст проверяем здесь, чтобы отличать зависшую камеру ("stale")
+            ts, frame = self.latest(camera.id, camera.rtsp_url, timeout, max_age=0)
+            if frame is None:
+                worker = self._workers.get(camera.id)
+                return camera.id, None, (worker.last_error if worker else None) or "timeout"
+            if max_age and time.time() - ts > max_age:
+                return camera.id, None, "stale"
+            return camera.id, frame, None
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=settings.CAPTURE_POOL_SIZE,
+                                                thread_name_prefix="fetch")
+            pool = self._pool
+
+        frames, failed = {}, {}
+        for camera_id, frame, error in pool.map(fetch, cameras):
+            if frame is None:
+                failed[camera_id] = error
+            else:
+                frames[camera_id] = frame
+        return frames, failed
+
+    def stop(self, camera_id):
+        with self._lock:
+            worker = self._workers.pop(camera_id, None)
+        if worker is not None:
+            worker.stop()
+
+    def stop_all(self):
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+capture_manager = CaptureManager()
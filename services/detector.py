@@ -1,20 +1,140 @@
 # Minimal wrapper for ultralytics YOLO model
 from ultralytics import YOLO
 import numpy as np
+import cv2
+
+
+def letterbox(img, imgsz=640, color=(114, 114, 114)):
+    """Вписывает изображение в квадрат imgsz x imgsz с сохранением пропорций.
+
+    Возвращает (картинка, масштаб, (pad_x, pad_y)) — для пересчёта боксов обратно.
+    """
+    h, w = img.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nw, nh = max(int(round(w * r)), 1), max(int(round(h * r)), 1)
+    if (nw, nh) != (w, h):
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    left, top = (imgsz - nw) // 2, (imgsz - nh) // 2
+    img = cv2.copyMakeBorder(img, top, imgsz - nh - top, left, imgsz - nw - left,
+                             cv2.BORDER_CONSTANT, value=color)
+    return img, r, (left, top)
+
+
+def detect_people_batch(model, crops, imgsz=640, conf=0.25, batch_size=16):
+    """Один батч-прогон YOLO по списку BGR-кропов.
+
+    Для каждого кропа возвращает список боксов людей (x1, y1, x2, y2, conf)
+    в координатах этого кропа. Пустые кропы дают пустой список.
+    """
+    boxes = [[] for _ in crops]
+    items = []
+    for i, crop in enumerate(crops):
+        if crop is None or crop.size == 0:
+            continue
+        img, r, pad = letterbox(crop, imgsz)
+        items.append((i, img, r, pad, crop.shape[:2]))
+
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        results = model.predict(source=[it[1] for it in chunk], imgsz=imgsz, conf=conf,
+                                classes=[0], verbose=False)
+        for (i, _, r, (pad_x, pad_y), (h, w)), res in zip(chunk, results):
+            if res.boxes is None or len(res.boxes) == 0:
+                continue
+            xyxy = res.boxes.xyxy.cpu().numpy()
+            confs = res.boxes.conf.cpu().numpy()
+            # из координат letterbox обратно в координаты кропа
+            xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad_x) / r).clip(0, w)
+            xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad_y) / r).clip(0, h)
+            boxes[i] = [(int(x1), int(y1), int(x2), int(y2), float(c))
+                        for (x1, y1, x2, y2), c in zip(xyxy, confs)]
+    return boxes
+
+
+def split_tiles(frame, tiles=1, overlap=0.1):
+    """Делит кадр на сетку tiles x tiles с перекрытием; возвращает [(x, y, tile), ...]."""
+    if tiles <= 1:
+        return [(0, 0, frame)]
+    h, w = frame.shape[:2]
+    th = min(h, int(np.ceil(h / tiles * (1 + overlap))))
+    tw = min(w, int(np.ceil(w / tiles * (1 + overlap))))
+    ys = np.linspace(0, h - th, tiles).astype(int)
+    xs = np.linspace(0, w - tw, tiles).astype(int)
+    return [(int(x), int(y), frame[y:y + th, x:x + tw]) for y in ys for x in xs]
+
+
+def nms_boxes(boxes, iou=0.5):
+    """Убирает дубликаты боксов на стыках тайлов."""
+    if len(boxes) < 2:
+        return boxes
+    rects = [[x1, y1, x2 - x1, y2 - y1] for x1, y1, x2, y2, _ in boxes]
+    scores = [c for *_, c in boxes]
+    keep = cv2.dnn.NMSBoxes(rects, scores, 0.0, iou)
+    return [boxes[int(i)] for i in np.array(keep).flatten()]
+
+
+def detect_people_frames(detect_fn, frames, tiles=1):
+    """Детекция людей на целых кадрах камер (опционально по тайлам).
+
+    detect_fn(crops) — батч-детектор со смыслом detect_people_batch (в этом
+    процессе или в пуле). Для каждого кадра возвращает боксы
+    (x1, y1, x2, y2, conf) в координатах кадра.
+    """
+    crops, owners = [], []
+    for i, frame in enumerate(frames):
+        for x, y, tile in split_tiles(frame, tiles):
+            crops.append(tile)
+            owners.append((i, x, y))
+
+    tile_boxes = detect_fn(crops)
+
+    boxes = [[] for _ in frames]
+    for (i, x, y), bxs in zip(owners, tile_boxes):
+        boxes[i].extend((x1 + x, y1 + y, x2 + x, y2 + y, c) for x1, y1, x2, y2, c in bxs)
+    if tiles > 1:
+        boxes = [nms_boxes(b) for b in boxes]
+    return boxes
+
+
+def classify_batch(model, crops, batch_size=32):
+    """Один батч-прогон классификатора по списку BGR-кропов.
+
+    Для каждого кропа возвращает (имя класса, уверенность); для пустых
+    кропов и ошибок — ("", 0.0).
+    """
+    labels = [("", 0.0) for _ in crops]
+    items = [(i, crop) for i, crop in enumerate(crops) if crop is not None and crop.size > 0]
+
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        results = model.predict(source=[crop for _, crop in chunk], verbose=False)
+        for (i, _), res in zip(chunk, results):
+            try:
+                cls_id = int(res.probs.top1)
+                labels[i] = (res.names[cls_id], float(res.probs.top1conf))
+            except Exception:
+                pass
+    return labels
+
 
 class PersonDetector:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, imgsz: int = 640, conf: float = 0.4, batch_size: int = 16):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.batch_size = batch_size
         try:
             self.model = YOLO(model_path)
         except Exception:
             self.model = None
 
+    def people_in_rois(self, frame_bgr, rois):
+        """Количество людей в каждом ROI (x, y, w, h) за один батч-прогон."""
+        crops = [frame_bgr[y:y+h, x:x+w] for x, y, w, h in rois]
+        if self.model is None:
+            return [0 for _ in crops]
+        boxes = detect_people_batch(self.model, crops, imgsz=self.imgsz, conf=self.conf,
+                                    batch_size=self.batch_size)
+        return [len(b) for b in boxes]
+
     def people_in_roi(self, frame_bgr, roi):
-        x,y,w,h = roi
-        crop = frame_bgr[y:y+h, x:x+w]
-        if crop.size == 0 or self.model is None:
-            return 0
-        results = self.model.predict(source=crop[:,:,::-1], imgsz=640, conf=0.4, classes=[0], verbose=False)
-        if not results or results[0].boxes is None:
-            return 0
-        return len(results[0].boxes)
+        return self.people_in_rois(frame_bgr, [roi])[0]
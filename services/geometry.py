@@ -0,0 +1,136 @@
+# Кэш геометрии ROI рабочих мест: bounding rect и маска полигона, уже обрезанная по нему
+import hashlib
+import json
+import threading
+
+import cv2
+import numpy as np
+
+
+def parse_polygon(poly_data):
+    """polygon_points (JSON-строка, список словарей или список пар) -> [[x, y], ...] или None."""
+    if not poly_data:
+        return None
+
+    # 1️⃣ если пришло как строка JSON — парсим
+    if isinstance(poly_data, str):
+        poly_data = json.loads(poly_data)
+
+    polygon = None
+    # 2️⃣ если это список словарей — превращаем в список координат
+    if isinstance(poly_data, list) and all(isinstance(p, dict) for p in poly_data):
+        polygon = [[int(p["x"]), int(p["y"])] for p in poly_data]
+
+    # 3️⃣ если это список списков — используем напрямую
+    elif isinstance(poly_data, list) and all(isinstance(p, (list, tuple)) for p in poly_data):
+        polygon = [[int(p[0]), int(p[1])] for p in poly_data]
+
+    if not polygon or len(polygon) < 3:
+        raise ValueError("polygon_points пуст или некорректен")
+    return polygon
+
+
+def geometry_hash(ws):
+    """Хэш всего, от чего зависит ROI рабочего места."""
+    raw = json.dumps([ws.polygon_points, ws.x, ws.y, ws.w, ws.h], sort_keys=True, default=str)
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+class RoiGeometry:
+    """Прямоугольник ROI в координатах кадра и (опционально) маска полигона размером h x w."""
+
+    def __init__(self, x, y, w, h, mask=None, polygon=None):
+        self.x, self.y, self.w, self.h = x, y, w, h
+        self.mask = mask
+        self.polygon = polygon
+
+    @classmethod
+    def from_workstation(cls, ws):
+        polygon = None
+        try:
+            polygon = parse_polygon(getattr(ws, "polygon_points", None))
+        except Exception as e:
+            print(f"⚠️ Ошибка polygon_points для ws {ws.id}: {e}")
+
+        if polygon:
+            pts = np.array(polygon, np.int32)
+            x, y, w, h = cv2.boundingRect(pts)
+            # маска сразу в координатах bounding box
+            mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(mask, [(pts - (x, y)).astype(np.int32)], 255)
+            return cls(x, y, w, h, mask, polygon)
+
+        return cls(ws.x, ws.y, ws.w, ws.h)
+
+    def crop(self, frame):
+        """Вырезает ROI из кадра. Всегда возвращает новый массив — кадр камеры общий."""
+        fh, fw = frame.shape[:2]
+        x0, y0 = max(self.x, 0), max(self.y, 0)
+        x1, y1 = min(self.x + self.w, fw), min(self.y + self.h, fh)
+        if x1 <= x0 or y1 <= y0:
+            return frame[0:0, 0:0].copy()
+
+        roi = frame[y0:y1, x0:x1]
+        if self.mask is None:
+            return roi.copy()
+        mask = self.mask[y0 - self.y:y1 - self.y, x0 - self.x:x1 - self.x]
+        return cv2.bitwise_and(roi, roi, mask=mask)
+
+
+class GeometryCache:
+    """Геометрия по id рабочего места; пересчитывается, когда меняется хэш полигона/прямоугольника."""
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, ws):
+        key = geometry_hash(ws)
+        with self._lock:
+            cached = self._items.get(ws.id)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        geom = RoiGeometry.from_workstation(ws)
+        with self._lock:
+            self._items[ws.id] = (key, geom)
+        return geom
+
+    def invalidate(self, ws_id):
+        with self._lock:
+            self._items.pop(ws_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+geometry_cache = GeometryCache()
+
+
+def assign_boxes(boxes, geoms):
+    """Раскладывает боксы кадра (x1, y1, x2, y2, conf) по ROI рабочих мест.
+
+    Бокс относится к рабочему месту, если его центр лежит внутри полигона
+    (проверка по закэшированной маске) или прямоугольника. Для каждой
+    геометрии возвращает список боксов в координатах её ROI.
+    """
+    result = [[] for _ in geoms]
+    if not boxes:
+        return result
+
+    arr = np.asarray(boxes, dtype=np.float32)
+    cx = ((arr[:, 0] + arr[:, 2]) / 2).astype(np.int32)
+    cy = ((arr[:, 1] + arr[:, 3]) / 2).astype(np.int32)
+
+    for k, g in enumerate(geoms):
+        inside = (cx >= g.x) & (cx < g.x + g.w) & (cy >= g.y) & (cy < g.y + g.h)
+        if g.mask is not None and inside.any():
+            idx = np.nonzero(inside)[0]
+            inside[idx] = g.mask[cy[idx] - g.y, cx[idx] - g.x] > 0
+        for x1, y1, x2, y2, conf in arr[inside]:
+            result[k].append((
+                int(min(max(x1 - g.x, 0), g.w)), int(min(max(y1 - g.y, 0), g.h)),
+                int(min(max(x2 - g.x, 0), g.w)), int(min(max(y2 - g.y, 0), g.h)),
+                float(conf),
+            ))
+    return result
@@ -0,0 +1,33 @@
+# HTTP-кэширование снимков (ETag по времени кадра) и неизменяемых миниатюр /images
+from fastapi import Request, Response
+from fastapi.staticfiles import StaticFiles
+
+from settings import settings
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def snapshot_etag(*parts):
+    """Слабый ETag из идентификатора камеры/места, времени кадра и параметров картинки."""
+    return 'W/"' + "-".join("" if p is None else str(p) for p in parts) + '"'
+
+
+def snapshot_headers(etag):
+    return {"ETag": etag, "Cache-Control": f"private, max-age={settings.SNAPSHOT_MAX_AGE_S}"}
+
+
+def not_modified(request: Request, etag):
+    """304 без тела, если клиент уже держит этот кадр (If-None-Match), иначе None."""
+    header = request.headers.get("if-none-match")
+    if header and (header.strip() == "*" or etag in [t.strip() for t in header.split(",")]):
+        return Response(status_code=304, headers=snapshot_headers(etag))
+    return None
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles с долгим Cache-Control: имена миниатюр уникальны (uuid), файлы не меняются."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
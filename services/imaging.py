@@ -0,0 +1,58 @@
+# Уменьшение и JPEG-кодирование кадров для UI (снимки и MJPEG-трансляции)
+import cv2
+
+from settings import settings
+
+try:
+    from turbojpeg import TurboJPEG  # PyTurboJPEG: кодирует заметно быстрее cv2.imencode
+except ImportError:
+    TurboJPEG = None
+
+_turbo = None
+
+
+def _turbo_encoder():
+    global _turbo
+    if _turbo is None:
+        _turbo = False
+        if TurboJPEG is not None:
+            try:
+                _turbo = TurboJPEG()
+            except Exception as e:
+                print(f"⚠️ libturbojpeg недоступна, кодируем через OpenCV: {e}")
+    return _turbo
+
+
+def fit_size(w, h, width=None, height=None):
+    """Масштаб, при котором w x h вписывается в width x height с сохранением пропорций; не больше 1."""
+    scale = 1.0
+    if width:
+        scale = min(scale, width / w)
+    if height:
+        scale = min(scale, height / h)
+    return scale
+
+
+def resize(img, width=None, height=None):
+    """Уменьшает кадр под width/height; возвращает (img, scale). Без уменьшения — тот же массив."""
+    h, w = img.shape[:2]
+    scale = fit_size(w, h, width, height)
+    if scale >= 1.0:
+        return img, 1.0
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA), scale
+
+
+def encode_jpeg(img, quality=None):
+    quality = quality or settings.JPEG_QUALITY
+    turbo = _turbo_encoder()
+    if turbo:
+        return turbo.encode(img, quality=quality)
+    _, jpeg = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return jpeg.tobytes()
+
+
+def render_jpeg(img, width=None, height=None, quality=None):
+    """Уменьшение и кодирование за один проход — полноразмерный кадр не кодируется."""
+    img, _ = resize(img, width, height)
+    return encode_jpeg(img, quality)
@@ -0,0 +1,143 @@
+# Пул процессов инференса: каждый процесс один раз грузит модели, кропы приходят через shared memory
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from services.detector import detect_people_batch, classify_batch
+from settings import settings
+
+# модели внутри процесса-воркера
+_detect_model = None
+_classify_model = None
+_opts = {}
+
+
+def _init_worker(detect_model_path, classify_model_path, threads, opts):
+    global _detect_model, _classify_model, _opts
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    from ultralytics import YOLO
+    _detect_model = YOLO(detect_model_path)
+    _classify_model = YOLO(classify_model_path)
+    _opts = opts
+
+
+def _attach(shm_name, meta):
+    """Представления numpy поверх shared memory — без копирования и без pickle."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = [
+        np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+        for offset, shape in meta
+    ]
+    return shm, arrays
+
+
+def _worker_detect(shm_name, meta):
+    shm, crops = _attach(shm_name, meta)
+    try:
+        return detect_people_batch(_detect_model, crops, imgsz=_opts["imgsz"],
+                                   batch_size=_opts["detect_batch_size"])
+    finally:
+        del crops
+        shm.close()
+
+
+def _worker_classify(shm_name, meta):
+    shm, crops = _attach(shm_name, meta)
+    try:
+        return classify_batch(_classify_model, crops, batch_size=_opts["classify_batch_size"])
+    finally:
+        del crops
+        shm.close()
+
+
+class InferenceTimeout(Exception):
+    """Процесс пула не вернул результат вовремя (упал или завис); пул пересоздан."""
+
+
+class InferencePool:
+    """N процессов с моделями детекции и классификации; задачи делятся между ними поровну."""
+
+    def __init__(self, workers, detect_model_path, classify_model_path, imgsz=640,
+                 detect_batch_size=16, classify_batch_size=32, timeout_s=None, timeout_per_crop_s=None):
+        self.workers = workers
+        self.timeout_s = timeout_s if timeout_s is not None else settings.INFERENCE_TIMEOUT_S
+        self.timeout_per_crop_s = (timeout_per_crop_s if timeout_per_crop_s is not None
+                                   else settings.INFERENCE_TIMEOUT_PER_CROP_S)
+        threads = max(1, (os.cpu_count() or workers) // workers)
+        opts = {
+            "imgsz": imgsz,
+            "detect_batch_size": detect_batch_size,
+            "classify_batch_size": classify_batch_size,
+        }
+        self._initargs = (detect_model_path, classify_model_path, threads, opts)
+        self._pool = self._start()
+
+    def _start(self):
+        ctx = mp.get_context("spawn")
+        return ctx.Pool(
+            processes=self.workers,
+            initializer=_init_worker,
+            initargs=self._initargs,
+        )
+
+    def _restart(self):
+        # результат задачи упавшего процесса Pool не вернёт никогда — пересоздаём пул целиком
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = self._start()
+
+    def _pack(self, images):
+        """Копирует кропы в один блок shared memory; возвращает (shm, [(offset, shape), ...])."""
+        images = [np.ascontiguousarray(img, dtype=np.uint8) for img in images]
+        total = sum(img.nbytes for img in images)
+        shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+        meta, offset = [], 0
+        for img in images:
+            np.ndarray(img.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[...] = img
+            meta.append((offset, img.shape))
+            offset += img.nbytes
+        return shm, meta
+
+    def _map(self, func, images):
+        if not images:
+            return []
+        # равные по количеству кропов куски — по одному на процесс
+        n = min(self.workers, len(images))
+        bounds = np.linspace(0, len(images), n + 1).astype(int)
+        tasks = []
+        try:
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                shm, meta = self._pack(images[a:b])
+                tasks.append((shm, self._pool.apply_async(func, (shm.name, meta)), b - a))
+            result = []
+            for _, task, count in tasks:
+                timeout = self.timeout_s + self.timeout_per_crop_s * count
+                try:
+                    result.extend(task.get(timeout))
+                except mp.TimeoutError:
+                    print("⚠️ Процесс инференса не ответил — пересоздаём пул")
+                    self._restart()
+                    raise InferenceTimeout(f"нет результата за {timeout:.0f} с")
+            return result
+        finally:
+            for shm, _, _ in tasks:
+                shm.close()
+                shm.unlink()
+
+    def detect(self, crops):
+        """Как detect_people_batch, но параллельно в процессах пула."""
+        return self._map(_worker_detect, list(crops))
+
+    def classify(self, crops):
+        """Как classify_batch, но параллельно в процессах пула."""
+        return self._map(_worker_classify, list(crops))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
@@ -1,6 +1,7 @@
 import cv2, os, time
 from datetime import datetime, timezone, timedelta
 from .detector import PersonDetector
+from .capture import capture_manager
 from ..database import SessionLocal
 from .. import models
 
@@ -18,13 +19,12 @@ class CameraWorker:
             cam = db.get(models.Camera, self.camera_id)
             if not cam or not cam.enabled:
                 return
-            cap = cv2.VideoCapture(cam.rtsp_url)
-            ok, frame = cap.read()
-            cap.release()
-            if not ok or frame is None:
+            _, frame = capture_manager.latest(cam.id, cam.rtsp_url)
+            if frame is None:
                 return
-            for ws in cam.workstations:
-                people = self.detector.people_in_roi(frame, (ws.x, ws.y, ws.w, ws.h))
+            # все ROI камеры — одним батчем
+            counts = self.detector.people_in_rois(frame, [(ws.x, ws.y, ws.w, ws.h) for ws in cam.workstations])
+            for ws, people in zip(cam.workstations, counts):
                 now = datetime.now(timezone.utc)
                 thumb = None
                 if people > 0:
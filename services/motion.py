@@ -0,0 +1,66 @@
+# Дешёвый детектор изменений ROI: пропускаем YOLO там, где картинка не поменялась
+import time
+
+import cv2
+import numpy as np
+
+from settings import settings
+from services.geometry import geometry_hash
+
+
+class MotionGate:
+    """Сравнивает уменьшенный серый ROI с тем, на котором последний раз запускали инференс.
+
+    Инференс нужен, если доля изменившихся пикселей больше threshold, если
+    прошлый результат старше max_stale_s или если геометрия ROI поменялась.
+    """
+
+    def __init__(self, threshold=None, pixel_diff=None, max_stale_s=None, size=None):
+        self.threshold = threshold if threshold is not None else settings.MOTION_THRESHOLD
+        self.pixel_diff = pixel_diff if pixel_diff is not None else settings.MOTION_PIXEL_DIFF
+        self.max_stale_s = max_stale_s if max_stale_s is not None else settings.MOTION_MAX_STALE_S
+        self.size = size or settings.MOTION_SIZE
+        # ws_id -> {"key", "small", "ts", "result"}
+        self._state = {}
+        self._pending = {}
+
+    def _small(self, roi):
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if roi.ndim == 3 else roi
+        small = cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        # лёгкое размытие гасит шум матрицы и сжатия
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def score(self, ws, roi):
+        """Доля изменившихся пикселей относительно опорного ROI (1.0 — опоры нет)."""
+        st = self._state.get(ws.id)
+        if roi.size == 0:
+            return 1.0
+        small = self._small(roi)
+        # кандидат в опорные кадры; принимается в remember(), если инференс запустят
+        self._pending[ws.id] = small
+        if st is None or st["key"] != geometry_hash(ws):
+            return 1.0
+        diff = cv2.absdiff(small, st["small"])
+        return float(np.count_nonzero(diff > self.pixel_diff)) / diff.size
+
+    def check(self, ws, roi, now=None):
+        """(нужен ли инференс, прошлый результат или None, оценка изменений)."""
+        now = time.time() if now is None else now
+        st = self._state.get(ws.id)
+        score = self.score(ws, roi)
+        if st is None or score > self.threshold or now - st["ts"] > self.max_stale_s:
+            return True, None, score
+        return False, st["result"], score
+
+    def remember(self, ws, result, now=None):
+        """Запоминает результат инференса и ROI из последнего check() как опорный."""
+        small = self._pending.pop(ws.id, None)
+        if small is None:
+            self._state.pop(ws.id, None)
+            return
+        self._state[ws.id] = {
+            "key": geometry_hash(ws),
+            "small": small,
+            "ts": time.time() if now is None else now,
+            "result": result,
+        }
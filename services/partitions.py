@@ -0,0 +1,82 @@
+# Помесячные партиции и индексы таблицы frames по captured_at
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+import models
+from settings import settings
+
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def add_months(d, n):
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def partition_name(d):
+    return f"frames_{d.year:04d}_{d.month:02d}"
+
+
+def frames_is_partitioned(conn):
+    return bool(conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'frames')"
+    )).scalar())
+
+
+def ensure_frame_partitions(bind, start=None, end=None, months_ahead=None):
+    """Создаёт недостающие помесячные партиции frames от месяца start до end + months_ahead.
+
+    bind — Engine или Connection. Возвращает список созданных/проверенных партиций.
+    Если frames ещё не партиционирована (старая схема) — ничего не делает.
+    """
+    if isinstance(bind, Engine):
+        with bind.begin() as conn:
+            return ensure_frame_partitions(conn, start, end, months_ahead)
+
+    conn = bind
+    if not frames_is_partitioned(conn):
+        print("⚠️ Таблица frames не партиционирована — запустите partition_frames.py")
+        return []
+
+    today = datetime.now().date()
+    months_ahead = settings.FRAMES_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    first = month_start(start or today)
+    last = add_months(month_start(end or today), months_ahead)
+
+    names = []
+    m = first
+    while m <= last:
+        name = partition_name(m)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF frames "
+            f"FOR VALUES FROM ('{m.isoformat()}') TO ('{add_months(m, 1).isoformat()}')"
+        ))
+        names.append(name)
+        m = add_months(m, 1)
+
+    # всё, что не попало в месячные диапазоны (например, кривые часы на сервере)
+    conn.execute(text("CREATE TABLE IF NOT EXISTS frames_default PARTITION OF frames DEFAULT"))
+    return names
+
+
+def ensure_frame_indexes(bind):
+    """Создаёт недостающие индексы models.Frame на существующей партиционированной таблице.
+
+    create_all индексы уже созданных таблиц не трогает. Индекс на партиционированной
+    frames строится по всем партициям с блокировкой записи — первый запуск может занять время.
+    Старую плоскую frames не трогаем: её индексы заняли бы имена, нужные partition_frames.py.
+    """
+    if isinstance(bind, Engine):
+        with bind.begin() as conn:
+            return ensure_frame_indexes(conn)
+
+    conn = bind
+    if not frames_is_partitioned(conn):
+        return
+    for index in models.Frame.__table__.indexes:
+        index.create(conn, checkfirst=True)
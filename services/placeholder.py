@@ -0,0 +1,83 @@
+# Заглушки «камера недоступна»: рисуются один раз, хранятся в LRU, строка статуса — не чаще раза в секунду
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+from services.capture import capture_manager
+from services.imaging import encode_jpeg, fit_size
+from settings import settings
+
+BASE_SIZE = (640, 480)
+STATUS_REFRESH_S = 1.0
+
+
+def placeholder_size(width=None, height=None):
+    """640x480, вписанный в запрошенные width/height (как кадр в services/imaging.resize)."""
+    scale = fit_size(*BASE_SIZE, width, height)
+    return max(1, round(BASE_SIZE[0] * scale)), max(1, round(BASE_SIZE[1] * scale))
+
+
+def render_base(message, size):
+    w, h = size
+    scale = w / BASE_SIZE[0]
+    img = Image.new("RGB", size, color=(200, 200, 200))
+    draw = ImageDraw.Draw(img)
+    draw.text((round(100 * scale), round(220 * scale)), message, fill=(255, 0, 0),
+              font_size=max(8, round(20 * scale)))
+    return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+
+
+def status_text(last_ts, last_error):
+    seen = datetime.fromtimestamp(last_ts).strftime("%d.%m %H:%M:%S") if last_ts else "never"
+    return f"last frame: {seen}  error: {last_error or 'timeout'}"
+
+
+class PlaceholderCache:
+    """LRU готовых JPEG-заглушек по (camera_id, размер, сообщение)."""
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or settings.PLACEHOLDER_CACHE_SIZE
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, camera_id, message, width=None, height=None, status=""):
+        size = placeholder_size(width, height)
+        key = (camera_id, size, message)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                if entry["status"] == status or now - entry["at"] < STATUS_REFRESH_S:
+                    return entry["jpeg"]
+
+        # заглушки нет или статус устарел — перерисовываем вне блокировки
+        base = entry["base"] if entry is not None else render_base(message, size)
+        img = base.copy()
+        if status:
+            font_scale = 0.45 * size[0] / BASE_SIZE[0]
+            cv2.putText(img, status, (10, size[1] - 12), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, (60, 60, 60), 1, cv2.LINE_AA)
+        jpeg = encode_jpeg(img)
+
+        with self._lock:
+            self._items[key] = {"base": base, "jpeg": jpeg, "status": status, "at": now}
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return jpeg
+
+
+placeholder_cache = PlaceholderCache()
+
+
+def camera_placeholder(camera_id, rtsp_url, width=None, height=None):
+    """Заглушка для недоступной камеры со временем последнего кадра и причиной ошибки."""
+    last_ts, last_error = capture_manager.status(camera_id)
+    return placeholder_cache.get(camera_id, "Cant connect to: " + rtsp_url, width, height,
+                                 status_text(last_ts, last_error))
@@ -0,0 +1,111 @@
+# Текущее присутствие на рабочих местах: держим в памяти, в presence_state пишем только переходы
+import datetime
+import json
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import models
+from settings import settings
+
+# канал NOTIFY, через который API (routers/ws.py) получает изменения присутствия
+PRESENCE_CHANNEL = "presence"
+# payload NOTIFY ограничен 8000 байтами — крупные пачки делим
+NOTIFY_CHUNK = 50
+
+def _local(dt):
+    """Локальное время без tzinfo — как пишет detect.py."""
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def iso_utc(dt):
+    """Время для клиентов /ws/presence: ISO-8601 в UTC со смещением; naive считается локальным."""
+    if dt is None:
+        return None
+    return dt.astimezone(datetime.timezone.utc).isoformat()
+
+
+def presence_item(workstation_id, is_present, last_seen):
+    """Элемент снимка/изменения присутствия в одном формате для БД-снимка и NOTIFY."""
+    return {"workstation_id": workstation_id, "is_present": is_present, "last_seen": iso_utc(last_seen)}
+
+
+class PresenceTracker:
+    """is_present / last_seen по рабочим местам.
+
+    Человек появился — переход в «есть» сразу; «нет» объявляется только если
+    человека не видели дольше ABSENCE_THRESHOLD_MIN (дребезг детектора и
+    короткие отлучки не дают лишних переходов).
+    """
+
+    def __init__(self, absence_threshold_min=None):
+        minutes = absence_threshold_min if absence_threshold_min is not None else settings.ABSENCE_THRESHOLD_MIN
+        self.absence_threshold = datetime.timedelta(minutes=minutes)
+        self._state = None  # workstation_id -> {"is_present", "last_seen"}
+
+    def _load(self, db):
+        self._state = {
+            r.workstation_id: {"is_present": bool(r.is_present), "last_seen": _local(r.last_seen)}
+            for r in db.query(models.PresenceState).all()
+        }
+
+    def update(self, db, rows, now=None):
+        """Применяет строки frames цикла; переходы пишутся одним upsert в транзакции db.
+
+        Возвращает список изменений [{"workstation_id", "is_present", "last_seen"}].
+        """
+        if self._state is None:
+            self._load(db)
+        now = now or datetime.datetime.now()
+
+        changed = {}
+        for row in sorted(rows, key=lambda r: r["captured_at"]):
+            ws_id = row["workstation_id"]
+            st = self._state.setdefault(ws_id, {"is_present": False, "last_seen": None})
+            if row["people_count"] > 0:
+                st["last_seen"] = _local(row["captured_at"])
+                if not st["is_present"]:
+                    st["is_present"] = True
+                    changed[ws_id] = st
+
+        # отсутствие — по таймеру, в том числе для мест, чья камера сейчас не отвечает
+        for ws_id, st in self._state.items():
+            if st["is_present"] and (st["last_seen"] is None or now - st["last_seen"] > self.absence_threshold):
+                st["is_present"] = False
+                changed[ws_id] = st
+
+        deltas = [
+            {"workstation_id": ws_id, "is_present": st["is_present"], "last_seen": st["last_seen"]}
+            for ws_id, st in changed.items()
+        ]
+        if deltas:
+            stmt = pg_insert(models.PresenceState).values(deltas)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.PresenceState.workstation_id],
+                set_={"is_present": stmt.excluded.is_present, "last_seen": stmt.excluded.last_seen},
+            )
+            db.execute(stmt)
+        return deltas
+
+    def snapshot(self):
+        """Текущее присутствие по всем известным рабочим местам."""
+        return [
+            {"workstation_id": ws_id, "is_present": st["is_present"], "last_seen": st["last_seen"]}
+            for ws_id, st in (self._state or {}).items()
+        ]
+
+    def reset(self):
+        """Сбрасывает состояние в памяти — будет перечитано из presence_state."""
+        self._state = None
+
+
+def publish_deltas(db, deltas):
+    """pg_notify с изменениями присутствия; подписчики получат их после commit транзакции db."""
+    for i in range(0, len(deltas), NOTIFY_CHUNK):
+        payload = json.dumps([presence_item(**d) for d in deltas[i:i + NOTIFY_CHUNK]])
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": PRESENCE_CHANNEL, "payload": payload})
+
+
+presence_tracker = PresenceTracker()
@@ -0,0 +1,188 @@
+# Материализованные интервалы присутствия: (workstation_id, is_present, start_at, end_at) по минутам
+from datetime import timedelta
+
+from sqlalchemy import delete, insert, text, update
+from sqlalchemy.orm.exc import StaleDataError
+
+import models
+from settings import settings
+
+
+def _minute(dt):
+    """Начало минуты в локальном времени без tzinfo (так пишет detect.py)."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt.replace(second=0, microsecond=0)
+
+
+class PresenceIntervalWriter:
+    """Инкрементально продлевает интервалы по мере поступления строк frames.
+
+    Минута считается «был», если хотя бы в одном кадре за неё people_count > 0.
+    Соседние минуты с одинаковым статусом склеиваются; разрыв больше
+    PRESENCE_MAX_GAP_MIN (например, камера не опрашивалась) открывает новый интервал.
+    """
+
+    def __init__(self, max_gap_min=None):
+        self.max_gap = timedelta(minutes=max_gap_min if max_gap_min is not None else settings.PRESENCE_MAX_GAP_MIN)
+        self._tails = None  # workstation_id -> последний интервал {"id", "is_present", "start_at", "end_at"}
+        self._prev = {}  # workstation_id -> интервал перед хвостом (для склейки после дребезга)
+
+    def _load_tails(self, db):
+        rows = db.execute(text("""
+            SELECT id, workstation_id, is_present, start_at, end_at
+            FROM (
+                SELECT *, row_number() OVER (PARTITION BY workstation_id ORDER BY start_at DESC) AS n
+                FROM presence_intervals
+            ) t
+            WHERE n <= 2
+            ORDER BY workstation_id, start_at
+        """)).all()
+        self._tails, self._prev = {}, {}
+        for r in rows:
+            self._prev[r.workstation_id] = self._tails.get(r.workstation_id)
+            self._tails[r.workstation_id] = {
+                "id": r.id,
+                "workstation_id": r.workstation_id,
+                "is_present": r.is_present,
+                "start_at": _minute(r.start_at),
+                "end_at": _minute(r.end_at),
+            }
+
+    def add_frames(self, db, rows):
+        """Обновляет интервалы по строкам frames; изменения пишутся в транзакции db (commit — снаружи)."""
+        if self._tails is None:
+            self._load_tails(db)
+        try:
+            with db.begin_nested():
+                self._write(db, *self._apply(rows))
+        except StaleDataError:
+            # compact_presence.py пересобрал интервалы — id хвостов устарели; перечитываем и повторяем
+            print("⚠️ presence_intervals пересобраны извне — перечитываем хвосты")
+            self._load_tails(db)
+            self._write(db, *self._apply(rows))
+
+    def _apply(self, rows):
+        """Продлевает хвосты в памяти; возвращает (новые, изменённые, удалённые id)."""
+        created, changed, deleted = [], {}, []
+        for row in sorted(rows, key=lambda r: r["captured_at"]):
+            ws_id = row["workstation_id"]
+            minute = _minute(row["captured_at"])
+            present = row["people_count"] > 0
+            tail = self._tails.get(ws_id)
+
+            if tail is not None and minute < tail["end_at"]:
+                # запоздавший кадр — интервалы уже ушли дальше
+                continue
+
+            if tail is not None and minute == tail["end_at"]:
+                if tail["is_present"] or not present:
+                    continue
+                # в текущей минуте появился человек: минута переходит в «был»
+                if tail["start_at"] == minute:
+                    prev = self._prev.get(ws_id)
+                    if prev is not None and prev["is_present"] and minute - prev["end_at"] <= self.max_gap:
+                        # минутный хвост «не был» от дребезга — поглощается предыдущим «был»
+                        prev["end_at"] = minute
+                        self._mark(prev, created, changed)
+                        self._drop(tail, created, changed, deleted)
+                        self._tails[ws_id] = prev
+                        self._prev[ws_id] = None
+                        continue
+                    tail["is_present"] = True
+                    self._mark(tail, created, changed)
+                    continue
+                tail["end_at"] = minute - timedelta(minutes=1)
+                self._mark(tail, created, changed)
+
+            elif (tail is not None and tail["is_present"] == present
+                  and minute - tail["end_at"] <= self.max_gap):
+                tail["end_at"] = minute
+                self._mark(tail, created, changed)
+                continue
+
+            self._prev[ws_id] = tail
+            tail = {"id": None, "is_present": present, "start_at": minute, "end_at": minute, "workstation_id": ws_id}
+            self._tails[ws_id] = tail
+            created.append(tail)
+        return created, changed, deleted
+
+    @staticmethod
+    def _write(db, created, changed, deleted):
+        if deleted:
+            db.execute(delete(models.PresenceInterval).where(models.PresenceInterval.id.in_(deleted)))
+        if created:
+            ids = db.execute(
+                insert(models.PresenceInterval).returning(models.PresenceInterval.id, sort_by_parameter_order=True),
+                [{"workstation_id": t["workstation_id"], "is_present": t["is_present"],
+                  "start_at": t["start_at"], "end_at": t["end_at"]} for t in created],
+            ).scalars().all()
+            for t, new_id in zip(created, ids):
+                t["id"] = new_id
+        if changed:
+            # по id; строки, удалённые пересборкой, дают StaleDataError
+            db.execute(update(models.PresenceInterval), list(changed.values()))
+
+    @staticmethod
+    def _drop(tail, created, changed, deleted):
+        if tail["id"] is None:
+            created[:] = [t for t in created if t is not tail]
+        else:
+            changed.pop(tail["id"], None)
+            deleted.append(tail["id"])
+
+    @staticmethod
+    def _mark(tail, created, changed):
+        # новые интервалы уйдут в INSERT целиком, для существующих копим UPDATE по id
+        if tail["id"] is None:
+            return
+        changed[tail["id"]] = {
+            "id": tail["id"],
+            "is_present": tail["is_present"],
+            "end_at": tail["end_at"],
+        }
+
+    def reset(self):
+        """Сбрасывает кэш хвостов — будут перечитаны из presence_intervals."""
+        self._tails = None
+        self._prev = {}
+
+
+def rebuild_intervals(conn, start, end, max_gap_min=None):
+    """Пересобирает интервалы из frames за [start, end) одним SQL (gaps-and-islands).
+
+    Для бэкфилла и периодической сверки; границы лучше брать по целым суткам.
+    """
+    gap = max_gap_min if max_gap_min is not None else settings.PRESENCE_MAX_GAP_MIN
+    params = {"start": start, "end": end, "gap": gap}
+    conn.execute(text("""
+        DELETE FROM presence_intervals
+        WHERE start_at >= :start AND start_at < :end
+    """), params)
+    return conn.execute(text("""
+        WITH m AS (
+            SELECT workstation_id,
+                   date_trunc('minute', captured_at) AS minute,
+                   bool_or(people_count > 0) AS is_present
+            FROM frames
+            WHERE captured_at >= :start AND captured_at < :end
+            GROUP BY 1, 2
+        ), g AS (
+            SELECT *,
+                   CASE WHEN lag(is_present) OVER w = is_present
+                         AND minute - lag(minute) OVER w <= make_interval(mins => :gap)
+                        THEN 0 ELSE 1 END AS brk
+            FROM m
+            WINDOW w AS (PARTITION BY workstation_id ORDER BY minute)
+        ), s AS (
+            SELECT *, sum(brk) OVER (PARTITION BY workstation_id ORDER BY minute) AS grp
+            FROM g
+        )
+        INSERT INTO presence_intervals (workstation_id, is_present, start_at, end_at)
+        SELECT workstation_id, bool_and(is_present), min(minute), max(minute)
+        FROM s
+        GROUP BY workstation_id, grp
+    """), params).rowcount
+
+
+presence_writer = PresenceIntervalWriter()
@@ -0,0 +1,88 @@
+# Срок хранения сырых кадров: старые frames сворачиваются в frames_hourly и удаляются вместе с JPEG
+import os
+import shutil
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from services.partitions import add_months, month_start, partition_name
+from services.rollup import refresh_hourly
+from settings import settings
+
+
+def frames_cutoff(today=None):
+    """Начало дня, с которого сырые frames ещё хранятся."""
+    today = today or date.today()
+    return datetime.combine(today - timedelta(days=settings.FRAMES_RETENTION_DAYS), datetime.min.time())
+
+
+def images_cutoff(today=None):
+    today = today or date.today()
+    days = settings.IMAGES_RETENTION_DAYS
+    if days is None:
+        days = settings.FRAMES_RETENTION_DAYS
+    return today - timedelta(days=days)
+
+
+def purge_frames(engine, cutoff):
+    """Сворачивает frames старше cutoff в часовые агрегаты и удаляет их.
+
+    Каждый день — отдельная транзакция: сначала frames_hourly, потом DELETE.
+    Месячные партиции, целиком ушедшие за cutoff, после агрегации удаляются через
+    DROP TABLE — без построчного DELETE и раздувания таблицы.
+    Возвращает число строк, удалённых через DELETE.
+    """
+    with engine.connect() as conn:
+        oldest = conn.execute(text("SELECT min(captured_at) FROM frames WHERE captured_at < :cutoff"),
+                              {"cutoff": cutoff}).scalar()
+    if oldest is None:
+        return 0
+    if oldest.tzinfo is not None:
+        oldest = oldest.astimezone().replace(tzinfo=None)
+
+    deleted = 0
+    day = datetime.combine(oldest.date(), datetime.min.time())
+    while day < cutoff:
+        m = month_start(day.date())
+        month_end = datetime.combine(add_months(m, 1), datetime.min.time())
+        if month_end <= cutoff:
+            # месяц устарел целиком: агрегируем по дням и удаляем партицию без DELETE
+            while day < month_end:
+                with engine.begin() as conn:
+                    refresh_hourly(conn, day, day + timedelta(days=1))
+                day += timedelta(days=1)
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {partition_name(m)}"))
+                # строки этого месяца, попавшие в frames_default
+                deleted += conn.execute(text("DELETE FROM frames WHERE captured_at >= :start AND captured_at < :end"),
+                                        {"start": datetime.combine(m, datetime.min.time()), "end": month_end}).rowcount
+            print(f"🗑 frames: удалена партиция {partition_name(m)}")
+            continue
+
+        end = min(day + timedelta(days=1), cutoff)
+        with engine.begin() as conn:
+            refresh_hourly(conn, day, end)
+            n = conn.execute(text("DELETE FROM frames WHERE captured_at >= :start AND captured_at < :end"),
+                             {"start": day, "end": end}).rowcount
+        if n:
+            print(f"🗑 frames {day:%d.%m.%Y}: удалено {n}")
+        deleted += n
+        day = end
+    return deleted
+
+
+def purge_images(images_root, cutoff):
+    """Удаляет папки миниатюр images/<ДДМесГГГГ> (см. detect.process_roi) старше cutoff."""
+    removed = 0
+    if not os.path.isdir(images_root):
+        return removed
+    for name in os.listdir(images_root):
+        try:
+            folder_date = datetime.strptime(name, "%d%b%Y").date()
+        except ValueError:
+            continue  # не папка дня — не трогаем
+        if folder_date < cutoff:
+            shutil.rmtree(os.path.join(images_root, name), ignore_errors=True)
+            print(f"🗑 images/{name}")
+            removed += 1
+    return removed
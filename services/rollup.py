@@ -0,0 +1,69 @@
+# Часовые агрегаты frames по рабочим местам (таблица frames_hourly)
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+
+def hour_start(dt):
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def refresh_hourly(conn, start, end):
+    """Пересчитывает часы [start, end) из frames одним INSERT ... ON CONFLICT.
+
+    Границы выравниваются по часу: каждый затронутый час пересчитывается целиком.
+    """
+    start = hour_start(start)
+    if end != hour_start(end):
+        end = hour_start(end) + timedelta(hours=1)
+    params = {"start": start, "end": end}
+    return conn.execute(text("""
+        INSERT INTO frames_hourly (workstation_id, hour, frames, present_frames, minutes, present_minutes,
+                                   conf_sum, conf_max, job_other, job_phone, job_work)
+        SELECT workstation_id,
+               date_trunc('hour', captured_at),
+               count(*),
+               count(*) FILTER (WHERE people_count > 0),
+               count(DISTINCT date_trunc('minute', captured_at)),
+               count(DISTINCT date_trunc('minute', captured_at)) FILTER (WHERE people_count > 0),
+               COALESCE(sum(conf) FILTER (WHERE people_count > 0), 0),
+               COALESCE(max(conf), 0),
+               count(*) FILTER (WHERE job_type = 1),
+               count(*) FILTER (WHERE job_type = 2),
+               count(*) FILTER (WHERE job_type = 3)
+        FROM frames
+        WHERE captured_at >= :start AND captured_at < :end
+        GROUP BY 1, 2
+        ON CONFLICT (workstation_id, hour) DO UPDATE SET
+            frames = EXCLUDED.frames,
+            present_frames = EXCLUDED.present_frames,
+            minutes = EXCLUDED.minutes,
+            present_minutes = EXCLUDED.present_minutes,
+            conf_sum = EXCLUDED.conf_sum,
+            conf_max = EXCLUDED.conf_max,
+            job_other = EXCLUDED.job_other,
+            job_phone = EXCLUDED.job_phone,
+            job_work = EXCLUDED.job_work
+    """), params).rowcount
+
+
+def refresh_recent(bind, now=None):
+    """Инкрементальное обновление: от последнего агрегированного часа (он мог быть неполным) до now.
+
+    Пустая frames_hourly заполняется с самого старого кадра. bind — Engine или Connection.
+    """
+    if isinstance(bind, Engine):
+        with bind.begin() as conn:
+            return refresh_recent(conn, now)
+
+    conn = bind
+    now = now or datetime.now()
+    start = conn.execute(text("SELECT max(hour) FROM frames_hourly")).scalar()
+    if start is None:
+        start = conn.execute(text("SELECT min(captured_at) FROM frames")).scalar()
+        if start is None:
+            return 0
+    if start.tzinfo is not None and now.tzinfo is None:
+        now = now.astimezone()
+    return refresh_hourly(conn, start, now)
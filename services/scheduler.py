@@ -0,0 +1,72 @@
+# Планировщик опроса камер: у каждой камеры свой интервал (Camera.poll_interval_s) и свой срок
+import heapq
+import time
+
+
+class CameraScheduler:
+    """Очередь с приоритетом по времени следующего опроса камеры (time.monotonic)."""
+
+    def __init__(self):
+        self._heap = []        # (due, camera_id)
+        self._due = {}         # camera_id -> актуальный срок (записи в куче с другим сроком устарели)
+        self._intervals = {}   # camera_id -> интервал опроса, сек
+
+    def sync(self, intervals, now=None):
+        """Синхронизирует список камер {camera_id: poll_interval_s} с базой.
+
+        Новые камеры разносятся по фазе внутри своего интервала, чтобы опросы
+        шли равномерно, а не пачкой; удалённые и выключенные — убираются.
+        """
+        now = time.monotonic() if now is None else now
+
+        for camera_id in list(self._intervals):
+            if camera_id not in intervals:
+                del self._intervals[camera_id]
+                del self._due[camera_id]
+
+        new = [c for c in intervals if c not in self._intervals]
+        for k, camera_id in enumerate(sorted(new)):
+            interval = max(int(intervals[camera_id] or 1), 1)
+            self._intervals[camera_id] = interval
+            self._push(camera_id, now + interval * k / len(new))
+
+        for camera_id, interval in intervals.items():
+            interval = max(int(interval or 1), 1)
+            if self._intervals[camera_id] != interval:
+                # интервал поменяли в UI — не ждём до старого срока
+                self._intervals[camera_id] = interval
+                self._push(camera_id, min(self._due[camera_id], now + interval))
+
+    def _push(self, camera_id, due):
+        self._due[camera_id] = due
+        heapq.heappush(self._heap, (due, camera_id))
+
+    def _drop_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        """Ближайший срок опроса или None, если камер нет."""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None, window=0.0):
+        """Камеры, срок которых наступил (с запасом window сек — чтобы собрать их в один батч).
+
+        Сразу планирует для них следующий опрос: срок + интервал, а если
+        цикл отстал — от текущего момента.
+        """
+        now = time.monotonic() if now is None else now
+        due_ids = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now + window:
+                break
+            due, camera_id = heapq.heappop(self._heap)
+            due_ids.append(camera_id)
+            interval = self._intervals[camera_id]
+            next_due = due + interval
+            if next_due <= now + window:
+                next_due = now + interval
+            self._push(camera_id, next_due)
+        return due_ids
@@ -7,7 +7,7 @@ from st_aggrid import AgGrid, GridOptionsBuilder, JsCode
 from settings import settings
 import streamlit.components.v1 as components
 
-import time
+from datetime import timedelta
 
 
 
@@ -93,11 +93,10 @@ if page == "Камеры":
                     st.session_state[key_state] = False  # по умолчанию поток выключен
 
                 if not st.session_state[key_state]:
-                    # показываем snapshot
-                    cachebuster = int(time.time() * 1000)
+                    # показываем snapshot (свежесть — через ETag/304, без cachebuster)
                     st.markdown(
                         f"""
-                                <img src="{API_URL}/cameras/{cam['id']}/snapshot?cachebuster={cachebuster}"
+                                <img src="{API_URL}/cameras/{cam['id']}/snapshot?width=640&height=480"
                                      width="640" height="480"
                                      style="border:1px solid #ccc;"/>
                                 """,
@@ -202,7 +201,7 @@ if page == "Рабочие места":
 
             ws_enabled = st.checkbox("Рабочее место используется", value=ws["enabled"], key=f"ws_enabled_{ws['id']}")
 
-            snapshot_url = f"{API_URL}/workstations/{ws['id']}/snapshot?cb={int(time.time())}"
+            snapshot_url = f"{API_URL}/workstations/{ws['id']}/snapshot"
 
             session_key = f"poly_points_{ws['id']}"
             if session_key not in st.session_state:
@@ -504,8 +503,8 @@ if page == "Контроль рабочих мест":
                    f.job_type
             FROM frames f
             LEFT JOIN workstations w ON f.workstation_id = w.id
-            WHERE f.captured_at::date BETWEEN '{start_date.strftime("%Y-%m-%d")}' 
-                                          AND '{end_date.strftime("%Y-%m-%d")}'
+            WHERE f.captured_at >= '{start_date.strftime("%Y-%m-%d")}'
+                AND f.captured_at < '{(end_date + timedelta(days=1)).strftime("%Y-%m-%d")}'
                 AND f.conf BETWEEN '{conf_min}' AND '{conf_max}'
                  {people_condition}
                  {ws_condition}
@@ -684,21 +683,20 @@ if page == "Отчет":
 
 
     try:
-
+        # интервалы присутствия уже посчитаны detect.py (таблица presence_intervals)
+        rep_from = rep_start_date.strftime("%Y-%m-%d")
+        rep_to = (rep_end_date + timedelta(days=1)).strftime("%Y-%m-%d")
         query = f"""
-            SELECT f.id,
-                  date_trunc('minute', f.captured_at) AS captured_at,
-                   w.name AS workstation_name,
-                   
-                   f.people_count,
-                   f.conf,
-                   f.job_type
-            FROM frames f
-            LEFT JOIN workstations w ON f.workstation_id = w.id
-            WHERE f.captured_at::date BETWEEN '{rep_start_date.strftime("%Y-%m-%d")}' 
-                                          AND '{rep_end_date.strftime("%Y-%m-%d")}'
+            SELECT w.name AS workstation_name,
+                   i.is_present,
+                   GREATEST(i.start_at, '{rep_from}'::timestamptz) AS start_at,
+                   LEAST(i.end_at, '{rep_to}'::timestamptz - interval '1 minute') AS end_at
+            FROM presence_intervals i
+            JOIN workstations w ON i.workstation_id = w.id
+            WHERE i.start_at < '{rep_to}'
+                AND i.end_at >= '{rep_from}'
                  {rep_condition}
-            ORDER BY workstation_name, f.id 
+            ORDER BY workstation_name, i.start_at
         """
         rep_df = pd.read_sql(query, engine)
     except Exception as e:
@@ -707,20 +705,8 @@ if page == "Отчет":
 
     if not rep_df.empty:
         # преобразуем timestamp
-        rep_df["captured_at"] = pd.to_datetime(rep_df["captured_at"])
-
-
-
-
-        # переименуем колонки
-        rep_df = rep_df.rename(columns={
-            "trigger": "Событие",
-            "conf": "Уверенность (%)",
-            "thumb_path": "Миниатюра",
-            "job_type": "Активность",
-        })
-
-
+        rep_df["start_at"] = pd.to_datetime(rep_df["start_at"])
+        rep_df["end_at"] = pd.to_datetime(rep_df["end_at"])
 
         # Рендерер для форматирования даты
         rep_date_renderer = JsCode("""
@@ -737,46 +723,15 @@ if page == "Отчет":
         }
         """)
 
-
-        rep_df["status"] = rep_df["people_count"].apply(lambda x: "✅ Был" if x > 0 else "❌ Не был")
-
-        # группировка по минутам
-        grouped = rep_df.groupby("captured_at")["status"].apply(
-            lambda s: "✅ Был" if "✅ Был" in s.values else "❌ Не был").reset_index()
-
-        # формируем интервалы
-        report_rows = []
-        current_status = None
-        start_time = None
-
-        for idx, row in grouped.iterrows():
-            if current_status is None:
-                current_status = row["status"]
-                start_time = row["captured_at"]
-            elif row["status"] != current_status:
-                report_rows.append({
-                    "Дата": start_time.strftime("%d.%m.%Y"),
-                    "Время начало": start_time.strftime("%H:%M"),
-                    "Время конец": grouped.loc[idx - 1, "captured_at"].strftime("%H:%M"),
-                    "Продолжительность": f"{int((grouped.iloc[idx --1]['captured_at'] - start_time).total_seconds() // 60)} мин",
-                    "Рабочее место": rep_df["workstation_name"].iloc[0],
-                    "Статус": current_status
-                })
-                current_status = row["status"]
-                start_time = row["captured_at"]
-
-        # добавляем последний интервал
-        if current_status is not None:
-            report_rows.append({
-                "Дата": start_time.strftime("%d.%m.%Y"),
-                "Время начало": start_time.strftime("%H:%M"),
-                "Время конец": grouped.iloc[-1]["captured_at"].strftime("%H:%M"),
-                "Продолжительность": f"{int((grouped.iloc[-1]['captured_at'] - start_time).total_seconds() // 60)} мин",
-                "Рабочее место": rep_df["workstation_name"].iloc[0],
-                "Статус": current_status
-            })
-
-        report_df = pd.DataFrame(report_rows)
+        # формируем строки отчёта из интервалов
+        report_df = pd.DataFrame({
+            "Дата": rep_df["start_at"].dt.strftime("%d.%m.%Y"),
+            "Время начало": rep_df["start_at"].dt.strftime("%H:%M"),
+            "Время конец": rep_df["end_at"].dt.strftime("%H:%M"),
+            "Продолжительность": ((rep_df["end_at"] - rep_df["start_at"]).dt.total_seconds() // 60).astype(int).astype(str) + " мин",
+            "Рабочее место": rep_df["workstation_name"],
+            "Статус": rep_df["is_present"].map({True: "✅ Был", False: "❌ Не был"}),
+        })
 
         # итоговая таблица
         rep_gb = GridOptionsBuilder.from_dataframe(report_df)